@@ -0,0 +1,135 @@
+"""Materialized per-category and per-brand aggregates, computed once per loaded catalog"""
+import numpy as np
+import pandas as pd
+
+# Every statistic the analytics endpoints read; name -> (column, function)
+STATS = {
+    "revenue": ("sale_amount", "sum"),
+    "products": ("product_code", "count"),
+    "sold": ("sale_qty", "sum"),
+    "avg_price": ("sale_price", "mean"),
+    "avg_merchants": ("merchant_count", "mean"),
+    "max_merchants": ("merchant_count", "max"),
+    "avg_rating": ("product_rate", "mean"),
+    "total_reviews": ("review_qty", "sum"),
+}
+
+
+def _group(df, keys):
+    return df.groupby(keys, observed=True).agg(**STATS).reset_index()
+
+
+class Aggregates:
+    """``STATS`` per category, brand, parent category and (category, brand).
+
+    Each table is a flat frame ordered by its keys, the same rows a
+    ``groupby(..., observed=True)`` on the catalog (or on one category's or
+    brand's rows) would produce, so the endpoints slice and sort it instead
+    of rescanning the catalog.
+    """
+
+    def __init__(self, df):
+        self.category = _group(df, "category_name")
+        self.brand = _group(df, "brand_name")
+        self.parent = _group(df, "_category_name")
+        self.category_brand = _group(df, ["category_name", "brand_name"])
+
+        # (category, brand) rows are sorted by category; a stable order by brand
+        # keeps categories sorted inside each brand
+        cb = self.category_brand
+        self._cat_codes = cb["category_name"].cat.codes.to_numpy()
+        brand_codes = cb["brand_name"].cat.codes.to_numpy()
+        self._brand_order = np.argsort(brand_codes, kind="stable")
+        self._brand_offsets = np.searchsorted(
+            brand_codes[self._brand_order], np.arange(len(cb["brand_name"].cat.categories) + 1)
+        )
+
+    @property
+    def nbytes(self):
+        tables = (self.category, self.brand, self.parent, self.category_brand)
+        return int(sum(t.memory_usage(index=False, deep=True).sum() for t in tables))
+
+    def brands_in_category(self, category):
+        """(category, brand) rows of one category, ordered by brand"""
+        categories = self.category_brand["category_name"].cat.categories
+        if category not in categories:
+            return self.category_brand.iloc[:0]
+        code = categories.get_loc(category)
+        lo, hi = np.searchsorted(self._cat_codes, [code, code + 1])
+        return self.category_brand.iloc[lo:hi]
+
+    def categories_of_brand(self, brand):
+        """(category, brand) rows of one brand, ordered by category"""
+        brands = self.category_brand["brand_name"].cat.categories
+        if brand not in brands:
+            return self.category_brand.iloc[:0]
+        code = brands.get_loc(brand)
+        return self.category_brand.iloc[self._brand_order[self._brand_offsets[code]:self._brand_offsets[code + 1]]]
+
+
+class Pareto:
+    """Rows by revenue, descending, with their running revenue: the catalog's Pareto curve.
+
+    ``order`` lists row positions by sale_amount descending (ties by
+    position), ``cumulative_pct`` is the share of total revenue of
+    ``order[:i + 1]`` in percent rounded to 2 digits. ``groups[column]``
+    holds the Pareto thresholds of every category or brand, all computed in
+    one pass over the rows grouped by code.
+    """
+
+    def __init__(self, df):
+        amount = df["sale_amount"].to_numpy()
+        self.n = len(amount)
+        self.order = np.argsort(-amount, kind="stable")
+        self.cumulative = np.cumsum(amount[self.order])
+        self.total = int(self.cumulative[-1]) if self.n else 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.cumulative_pct = np.round(self.cumulative / self.total * 100, 2)
+        self.groups = {column: self._group_thresholds(df, amount, column) for column in ("category_name", "brand_name")}
+
+    @property
+    def nbytes(self):
+        arrays = (self.order, self.cumulative, self.cumulative_pct)
+        tables = sum(int(t.memory_usage(index=False, deep=True).sum()) for t in self.groups.values())
+        return sum(a.nbytes for a in arrays) + tables
+
+    def product_pct(self, positions):
+        """Share of products in percent (4 digits) of the first ``positions + 1`` rows"""
+        return np.round((np.asarray(positions) + 1) / self.n * 100, 4)
+
+    def curve(self, points):
+        """(product_pct, revenue_pct) of every ``n // points``-th row, starting with the first"""
+        step = max(1, self.n // points)
+        positions = np.arange(0, self.n, step)
+        return self.product_pct(positions), self.cumulative_pct[positions]
+
+    def threshold(self, pct):
+        """product_pct of the first row where the running revenue reaches ``pct`` percent, else 100"""
+        i = int(np.searchsorted(self.cumulative_pct, pct, side="left"))
+        return self.product_pct(i) if i < self.n else 100
+
+    def _group_thresholds(self, df, amount, column):
+        series = df[column]
+        codes = series.cat.codes.to_numpy()
+        # Rows by group, by revenue descending inside each group
+        rows = self.order[np.argsort(codes[self.order], kind="stable")]
+        group = codes[rows]
+        rows, group = rows[group >= 0], group[group >= 0]
+        n_groups = len(series.cat.categories)
+
+        running = np.concatenate([[0], np.cumsum(amount[rows])])
+        products = np.bincount(group, minlength=n_groups)
+        ends = np.cumsum(products)
+        starts = ends - products
+        revenue = running[ends] - running[starts]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            share = (running[1:] - running[starts][group]) / revenue[group]
+            table = {"name": series.cat.categories, "products": products, "revenue": revenue}
+            for pct in (80, 95):
+                # Running shares only grow inside a group: rows below the target come first
+                below = np.bincount(group, weights=share < pct / 100, minlength=n_groups)
+                table[f"pct_{pct}"] = np.where(revenue > 0, np.round((below + 1) / products * 100, 2), 100.0)
+            first = amount[rows[np.minimum(starts, len(rows) - 1)]] if len(rows) else np.zeros(n_groups)
+            table["top_product_pct"] = np.where(revenue > 0, np.round(first / revenue * 100, 2), 0.0)
+        frame = pd.DataFrame(table)
+        return frame[frame["products"] > 0].reset_index(drop=True)
@@ -0,0 +1,171 @@
+"""Versioned LRU cache of rendered JSON responses with ETag revalidation"""
+import functools
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+
+from fastapi import Request
+from fastapi.responses import Response
+
+
+def _etag(body):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def _matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """One execution per key at a time: callers arriving while it runs wait and share its result"""
+
+    def __init__(self):
+        self._calls = {}  # key -> _Call in flight
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0  # calls answered by another caller's execution
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                self.executions += 1
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"executions": self.executions, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class ResponseCache:
+    """Rendered bodies keyed by (endpoint, validated arguments, data version).
+
+    Bounded by the total size of the stored bodies; the least recently used
+    entries are evicted first. Entries of an older data version are never
+    hit again and age out the same way. Concurrent misses of one key are
+    computed once (``flights``) and the other requests wait for that result.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (body, etag)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.flights = SingleFlight()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body):
+        entry = (body, _etag(body))
+        with self._lock:
+            if key in self.entries:
+                self.nbytes -= len(self.entries.pop(key)[0])
+            if len(body) <= self.max_bytes:
+                self.entries[key] = entry
+                self.nbytes += len(body)
+            while self.nbytes > self.max_bytes:
+                _, (old, _) = self.entries.popitem(last=False)
+                self.nbytes -= len(old)
+                self.evictions += 1
+        return entry
+
+    def _fill(self, key, func, kwargs):
+        """The entry of ``key``, rendered by ``func`` unless a request just before stored it;
+        a non-200 response is returned as is"""
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is not None:
+            return entry
+        response = func(**kwargs)
+        if response.status_code != 200:
+            return response
+        return self.put(key, response.body)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self.entries),
+                "bytes": self.nbytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+                "evictions": self.evictions,
+            }
+
+    def endpoint(self, version):
+        """Cache a JSON endpoint's 200 responses per ``version()`` of the data.
+
+        Adds a ``request`` parameter to the endpoint's signature to read the
+        path and ``If-None-Match``; a matching ETag is answered with
+        304 and no body.
+        """
+        def decorate(func):
+            sig = inspect.signature(func)
+
+            @functools.wraps(func)
+            def wrapper(request, **kwargs):
+                # Keyed on the validated arguments, not the query string: defaults, spellings
+                # like 0200 and unknown parameters all map to the response they produce
+                params = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in kwargs.items()))
+                key = (request.url.path, params, version())
+                if_none_match = request.headers.get("if-none-match")
+                entry = self.get(key)
+                if entry is None:
+                    entry = self.flights.do(key, lambda: self._fill(key, func, kwargs))
+                    if isinstance(entry, Response):
+                        return entry
+                body, etag = entry
+                headers = {"ETag": etag, "Cache-Control": "no-cache"}
+                if _matches(if_none_match, etag):
+                    with self._lock:
+                        self.not_modified += 1
+                    return Response(status_code=304, headers=headers)
+                return Response(body, media_type="application/json", headers=headers)
+
+            request = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+            params = [p.replace(kind=inspect.Parameter.KEYWORD_ONLY) for p in sig.parameters.values()]
+            wrapper.__signature__ = sig.replace(parameters=[request, *params])
+            return wrapper
+        return decorate
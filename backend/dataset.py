@@ -0,0 +1,194 @@
+"""One loaded version of the catalog together with every index derived from it"""
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import filters
+import ingest
+import quantiles
+import search
+import snapshot
+
+
+def _build_product_index(data):
+    codes = data["product_code"].tolist()
+    # Filled back to front so the first row wins for duplicated codes
+    return dict(zip(reversed(codes), range(len(codes) - 1, -1, -1)))
+
+
+def _build_suggester(data, column):
+    names = data[column].cat.categories
+    stats = (
+        data.groupby(column, observed=False)
+        .agg(revenue=("sale_amount", "sum"), products=("sale_amount", "size"))
+        .reindex(names, fill_value=0)
+    )
+    return search.PrefixSuggester(names.tolist(), revenue=stats["revenue"].to_numpy(), products=stats["products"].to_numpy())
+
+
+# Model-derived columns, sortable in /api/products like filters.SORT_COLUMNS
+PREDICTION_COLUMNS = ("predicted_sales", "sales_gap")
+
+
+class Predictions:
+    """``predicted_sales`` of every row under one SalesModel and ``sales_gap = sale_qty - predicted_sales``"""
+
+    def __init__(self, df, sales_model, code_rank):
+        self.fingerprint = sales_model.fingerprint
+        predicted = sales_model.predict_catalog(df)
+        self.columns = {"predicted_sales": predicted, "sales_gap": df["sale_qty"].to_numpy() - predicted}
+        self.sort_index = filters.SortIndex(pd.DataFrame(self.columns), PREDICTION_COLUMNS, code_rank)
+
+
+class Dataset:
+    """The catalog frame and its indexes, built together and never mutated.
+
+    A request reads the module-level dataset once and uses that object
+    throughout, so replacing it (a single assignment) never shows a request
+    a frame from one version and an index from another. The only thing
+    filled in later is the model's Predictions, which are replaced as a
+    whole when the model changes.
+    """
+
+    def __init__(self, df, version):
+        self.df = df
+        self.version = version
+        self.product_index = _build_product_index(df)  # product_code -> row position in df
+
+        start = time.perf_counter()
+        self.name_index = search.TrigramIndex(df["product_name"].tolist())
+        self.brand_index = search.TrigramIndex(df["brand_name"].cat.categories.tolist())
+        print(f"Search index: {(self.name_index.nbytes + self.brand_index.nbytes) / 1024 / 1024:.1f} MB, "
+              f"built in {time.perf_counter() - start:.2f}s")
+        self.category_suggester = _build_suggester(df, "category_name")
+        self.brand_suggester = _build_suggester(df, "brand_name")
+
+        start = time.perf_counter()
+        self.sort_index = filters.SortIndex(df)
+        print(f"Sort index: {self.sort_index.nbytes / 1024 / 1024:.1f} MB, built in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        self.price_index = filters.CategoryPriceIndex(df)
+        print(f"Price index: {self.price_index.nbytes / 1024 / 1024:.1f} MB, built in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        self.aggs = aggregates.Aggregates(df)
+        print(f"Aggregates: {self.aggs.nbytes / 1024 / 1024:.1f} MB, built in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        self.pareto = aggregates.Pareto(df)
+        print(f"Pareto: {self.pareto.nbytes / 1024 / 1024:.1f} MB, built in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        self.quantiles = quantiles.QuantileTables(df)
+        print(f"Quantile tables: {self.quantiles.nbytes / 1024 / 1024:.1f} MB, built in {time.perf_counter() - start:.2f}s")
+        self._predictions = None
+        self._predictions_lock = threading.Lock()
+
+    def __getstate__(self):
+        # Pickled to share one dataset between processes (see shared.py)
+        state = self.__dict__.copy()
+        del state["_predictions_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._predictions_lock = threading.Lock()
+
+    def predictions(self, sales_model):
+        """Predictions of the whole catalog under ``sales_model``, scored once per model (None without one)"""
+        if sales_model is None:
+            return None
+        current = self._predictions
+        if current is not None and current.fingerprint == sales_model.fingerprint:
+            return current
+        with self._predictions_lock:
+            current = self._predictions
+            if current is None or current.fingerprint != sales_model.fingerprint:
+                start = time.perf_counter()
+                current = Predictions(self.df, sales_model, self.sort_index.code_rank)
+                self._predictions = current
+                print(f"Predicted sales for {len(self.df)} products in {time.perf_counter() - start:.2f}s")
+            return current
+
+    def similar_products(self, category, price, tolerance, k, exclude=None):
+        """Positions of the ``k`` best-selling ``category`` rows priced within ``price`` ± ``tolerance``
+        (a fraction), best first; ``exclude`` drops the rows of that product_code"""
+        rows = self.price_index.window(category, price * (1 - tolerance), price * (1 + tolerance))
+        if exclude is not None:
+            rows = rows[self.df["product_code"].to_numpy()[rows] != exclude]
+        return filters.top_k(rows, self.df["sale_qty"].to_numpy(), k)
+
+    def search_rows(self, query):
+        """Sorted positions of rows whose product or brand name contains ``query``"""
+        rows = self.name_index.search(query)
+        brand_codes = self.brand_index.search(query)
+        if len(brand_codes):
+            brand_rows = np.flatnonzero(np.isin(self.df["brand_name"].cat.codes.to_numpy(), brand_codes))
+            rows = np.union1d(rows, brand_rows)
+        return rows
+
+
+def read_frame(csv_path, snapshot_dir):
+    """The cleaned catalog from a fresh snapshot, or parsed from the CSV and snapshotted"""
+    start = time.perf_counter()
+    data = snapshot.load(csv_path, snapshot_dir)
+    if data is not None:
+        print(f"Loaded {len(data)} products from snapshot in {time.perf_counter() - start:.2f}s")
+    else:
+        fp = snapshot.fingerprint(csv_path)
+        print(f"Loading CSV ({ingest.CSV_ENGINE} engine)...")
+        data = ingest.read_catalog(csv_path, "api")
+        print(f"Loaded {len(data)} products in {time.perf_counter() - start:.2f}s")
+        try:
+            snapshot.save(data, csv_path, snapshot_dir, fp)
+            print("Snapshot saved")
+        except OSError as e:
+            print(f"Could not save snapshot: {e}")
+    print(f"preview_image_list: {data.attrs.get('image_parse_failures', 0)} rows failed to parse")
+    print("Memory:\n  " + "\n  ".join(ingest.memory_report(data)))
+    return data
+
+
+def load(csv_path, snapshot_dir, version):
+    return Dataset(read_frame(csv_path, snapshot_dir), version)
+
+
+if __name__ == "__main__":
+    # Load check: build every index from the first rows of a CSV with some
+    # product codes blanked out, then page each sort order by offset and by cursor
+    import os
+    import shutil
+    import sys
+    import tempfile
+
+    DIR = os.path.dirname(os.path.abspath(__file__))
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(DIR, "kaspi.csv")
+    sample = pd.read_csv(csv_path, encoding="utf-8", dtype=str, nrows=500)
+    sample.loc[sample.index[::7], "product_code"] = None
+    engines = sorted({ingest.CSV_ENGINE, "c"})  # the engines read blanks differently
+    for engine in engines:
+        ingest.CSV_ENGINE = engine
+        tmp = tempfile.mkdtemp()
+        sample_path = os.path.join(tmp, "sample.csv")
+        sample.to_csv(sample_path, index=False)
+        ds = load(sample_path, os.path.join(tmp, "snapshot"), 1)
+        codes = ds.df["product_code"].fillna("").to_numpy(dtype=object)
+        for column in filters.SORT_COLUMNS:
+            values = ds.df[column].to_numpy()
+            for descending in (False, True):
+                rows = np.concatenate([
+                    filters.sorted_page(ds.sort_index, column, descending, None, start, 50)[1]
+                    for start in range(0, len(ds.df), 50)
+                ])
+                keys = [(values[i], codes[i]) for i in rows]
+                if sorted(rows.tolist()) != list(range(len(ds.df))) or keys != sorted(keys, reverse=descending):
+                    sys.exit(f"{engine}: {column} {'desc' if descending else 'asc'}: pages out of order")
+                # A cursor from the middle row continues right after that (value, code)
+                middle = rows[len(rows) // 2]
+                boundary = filters.seek(ds.sort_index, column, descending, values, ds.df["product_code"].to_numpy(),
+                                        (values[middle], codes[middle]))
+                after = filters.sorted_page(ds.sort_index, column, descending, None, 0, 50, boundary)[1]
+                if len(after) and keys[rows.tolist().index(after[0])] == (values[middle], codes[middle]):
+                    sys.exit(f"{engine}: {column} {'desc' if descending else 'asc'}: cursor page repeats its key")
+        shutil.rmtree(tmp)
+    print(f"Load check passed ({', '.join(engines)}): {len(sample)} rows, {int(sample['product_code'].isna().sum())} without product_code")
@@ -0,0 +1,46 @@
+"""Feature encoding shared by train_model.py and the models it saves.
+
+Model inputs are always [category code, brand code, sale_price,
+merchant_count] with the codes from encoders.joblib, so every saved model
+is served the same way; anything a model needs on top of that is a step of
+the saved pipeline and lives here, importable by the backend.
+"""
+import numpy as np
+from sklearn.base import BaseEstimator, TransformerMixin
+
+FEATURES = ["category_name", "brand_name", "sale_price", "merchant_count"]
+CATEGORICAL = [0, 1]  # positions of the label-encoded columns
+
+
+class TopCategories(BaseEstimator, TransformerMixin):
+    """Re-codes label-encoded columns to at most ``max_categories`` native categories.
+
+    Histogram gradient boosting takes at most 255 categories per feature: the
+    most frequent ``max_categories - 1`` codes keep their own category and
+    all others (and codes never seen in fit) share the last one.
+    """
+
+    def __init__(self, columns=tuple(CATEGORICAL), max_categories=255):
+        self.columns = columns
+        self.max_categories = max_categories
+
+    def fit(self, X, y=None):
+        X = np.asarray(X)
+        self.lookups_ = []
+        for col in self.columns:
+            counts = np.bincount(X[:, col].astype(np.int64))
+            keep = np.argsort(-counts, kind="stable")[:self.max_categories - 1]
+            keep = keep[counts[keep] > 0]
+            # One slot past the seen codes stands for every code unseen in fit
+            lookup = np.full(len(counts) + 1, len(keep), dtype=np.int64)
+            lookup[keep] = np.arange(len(keep))
+            self.lookups_.append(lookup)
+        return self
+
+    def transform(self, X):
+        X = np.array(X, dtype=np.float64)
+        for col, lookup in zip(self.columns, self.lookups_):
+            codes = X[:, col].astype(np.int64)
+            codes[(codes < 0) | (codes >= len(lookup))] = len(lookup) - 1
+            X[:, col] = lookup[codes]
+        return X
@@ -0,0 +1,182 @@
+"""Catalog filtering and sorted paging on masks and row positions instead of frames"""
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+SORT_COLUMNS = ("sale_amount", "sale_price", "product_rate", "review_qty", "sale_qty", "show_order_num")
+
+
+class SortIndex:
+    """Precomputed sort permutations of the catalog for every sortable column.
+
+    ``order[col]`` lists row positions by (col, product_code) ascending, and
+    ``rank[col]`` is its inverse. Descending order is the same permutation read
+    backwards, so ties are always broken by product_code and pages are stable.
+    A missing product_code ranks as "", before every other code.
+    ``code_rank`` of another index over the same rows can be passed in to
+    index extra columns without sorting the codes again.
+    """
+
+    def __init__(self, df, columns=SORT_COLUMNS, code_rank=None):
+        if code_rank is None:
+            codes = df["product_code"].fillna("").to_numpy(dtype=object)
+            code_order = np.argsort(codes, kind="stable")
+            code_rank = np.empty(len(df), dtype=np.int32)
+            code_rank[code_order] = np.arange(len(df), dtype=np.int32)
+        self.code_rank = code_rank
+        self.order = {}
+        self.rank = {}
+        for col in columns:
+            order = np.lexsort((self.code_rank, df[col].to_numpy())).astype(np.int32)
+            rank = np.empty(len(df), dtype=np.int32)
+            rank[order] = np.arange(len(df), dtype=np.int32)
+            self.order[col], self.rank[col] = order, rank
+
+    @property
+    def nbytes(self):
+        return self.code_rank.nbytes + sum(a.nbytes for a in self.order.values()) + sum(a.nbytes for a in self.rank.values())
+
+
+def _equals(series, value):
+    """Mask of a dictionary-encoded column equal to ``value``, compared on codes"""
+    categories = series.cat.categories
+    codes = series.cat.codes.to_numpy()
+    if value not in categories:
+        return np.zeros(len(codes), dtype=bool)
+    return codes == categories.get_loc(value)
+
+
+def filter_mask(df, rows=None, category=None, brand=None, abc=None, min_price=None, max_price=None):
+    """Boolean mask of the rows passing every given filter, or None if none is set.
+
+    ``rows`` are positions already selected by another index (e.g. search).
+    """
+    conditions = []
+    if rows is not None:
+        selected = np.zeros(len(df), dtype=bool)
+        selected[rows] = True
+        conditions.append(selected)
+    if category:
+        conditions.append(_equals(df["category_name"], category))
+    if brand:
+        conditions.append(_equals(df["brand_name"], brand))
+    if abc is not None:
+        conditions.append(df["amount_abc"].to_numpy() == abc)
+    if min_price is not None:
+        conditions.append(df["sale_price"].to_numpy() >= min_price)
+    if max_price is not None:
+        conditions.append(df["sale_price"].to_numpy() <= max_price)
+
+    if not conditions:
+        return None
+    mask = conditions[0]
+    for cond in conditions[1:]:
+        mask &= cond
+    return mask
+
+
+def seek(index, column, descending, values, codes, key):
+    """Position in ``order[column]`` where rows after the (value, product_code) ``key`` begin.
+
+    Ascending pages continue at the returned position; descending pages end
+    just before it. Found by bisecting the permutation, so it needs no extra
+    memory and stays valid after the rows move around on a reload.
+    """
+    order = index.order[column]
+
+    def sort_key(i):
+        code = codes[order[i]]
+        return values[order[i]], code if isinstance(code, str) else ""
+
+    if descending:
+        return bisect_left(range(len(order)), tuple(key), key=sort_key)
+    return bisect_right(range(len(order)), tuple(key), key=sort_key)
+
+
+def sorted_page(index, column, descending, mask, start, count, boundary=None, chunk=8192):
+    """Return (total, positions) of rows ``start:start + count`` passing ``mask``.
+
+    With ``boundary`` (from ``seek``) the page starts right after a cursor
+    instead of at the beginning of the order. Selective masks are sorted
+    through ``rank``; broad ones walk the precomputed permutation in chunks
+    and stop once the page is filled.
+    """
+    order = index.order[column]
+    n = len(order)
+    lo, hi = 0, n
+    if boundary is not None:
+        lo, hi = (0, boundary) if descending else (boundary, n)
+
+    if mask is None:
+        total = n
+        if descending:
+            return total, order[max(lo, hi - start - count):max(lo, hi - start)][::-1]
+        return total, order[lo + start:min(hi, lo + start + count)]
+
+    total = int(np.count_nonzero(mask))
+    if total * 8 < n:
+        positions = np.flatnonzero(mask)
+        ranks = index.rank[column][positions]
+        if boundary is not None:
+            inside = (ranks >= lo) & (ranks < hi)
+            positions, ranks = positions[inside], ranks[inside]
+        positions = positions[np.argsort(-ranks if descending else ranks)]
+        return total, positions[start:start + count]
+
+    need = start + count
+    found, got = [], 0
+    for begin in range(0, hi - lo, chunk):
+        if descending:
+            part = order[max(lo, hi - begin - chunk):hi - begin][::-1]
+        else:
+            part = order[lo + begin:min(hi, lo + begin + chunk)]
+        hits = part[mask[part]]
+        found.append(hits)
+        got += len(hits)
+        if got >= need:
+            break
+    if not found:
+        return total, order[:0]
+    return total, np.concatenate(found)[start:need]
+
+
+class CategoryPriceIndex:
+    """Row positions grouped by category and sorted by price within each one.
+
+    The rows of a category with a price in [lo, hi] are one contiguous slice
+    of ``rows``, found with two binary searches over ``prices``.
+    """
+
+    def __init__(self, df):
+        column = df["category_name"]
+        codes = column.cat.codes.to_numpy()
+        prices = df["sale_price"].to_numpy()
+        # Rows without a category (code -1) sort first and are never looked up
+        self.rows = np.lexsort((np.arange(len(df)), prices, codes)).astype(np.int32)
+        self.prices = prices[self.rows]
+        self.offsets = np.searchsorted(codes[self.rows], np.arange(len(column.cat.categories) + 1))
+        self.category_codes = {name: i for i, name in enumerate(column.cat.categories.tolist())}
+
+    @property
+    def nbytes(self):
+        return self.rows.nbytes + self.prices.nbytes + self.offsets.nbytes
+
+    def window(self, category, lo, hi):
+        """Positions of the ``category`` rows priced lo..hi inclusive, by price then position"""
+        code = self.category_codes.get(category)
+        if code is None:
+            return self.rows[:0]
+        begin, end = self.offsets[code], self.offsets[code + 1]
+        prices = self.prices[begin:end]
+        return self.rows[begin + np.searchsorted(prices, lo, side="left"):begin + np.searchsorted(prices, hi, side="right")]
+
+
+def top_k(positions, values, k):
+    """The ``k`` of ``positions`` with the largest ``values``, ties by position, without sorting them all"""
+    if k <= 0:
+        return positions[:0]
+    if len(positions) > k:
+        candidate = values[positions]
+        kth = np.partition(candidate, len(candidate) - k)[len(candidate) - k]
+        positions = positions[candidate >= kth]
+    return positions[np.lexsort((positions, -values[positions]))][:k]
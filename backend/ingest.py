@@ -0,0 +1,181 @@
+"""Typed ingestion of kaspi.csv shared by the API and the training script"""
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    CSV_ENGINE = "pyarrow"
+except ImportError:
+    CSV_ENGINE = "c"
+
+# The cells pandas' C engine reads as missing, so both engines agree on nulls
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+# Column -> target dtype, fill value for unparseable numbers, date format.
+# "category" columns are dictionary-encoded (integer codes + a sorted value table).
+SCHEMA = {
+    "product_code": {"dtype": "str"},
+    "product_name": {"dtype": "str"},
+    "brand_name": {"dtype": "category"},
+    "category_name": {"dtype": "category"},
+    "_category_name": {"dtype": "category"},
+    "product_url": {"dtype": "str", "optional": True},
+    "preview_image_list": {"dtype": "str"},
+    "sale_price": {"dtype": "int64", "fill": 0},
+    "sale_qty": {"dtype": "int64", "fill": 0},
+    "sale_amount": {"dtype": "int64", "fill": 0},
+    "product_rate": {"dtype": "float64", "fill": 0},
+    "review_qty": {"dtype": "int64", "fill": 0},
+    "merchant_count": {"dtype": "int64", "fill": 0},
+    "amount_abc": {"dtype": "int64", "fill": 3},
+    "show_order_num": {"dtype": "int64", "fill": 0},
+    "created_dt": {"dtype": "datetime", "format": "ISO8601"},
+    "last_sale_date": {"dtype": "datetime", "format": "ISO8601"},
+}
+
+# Columns read by each consumer of the CSV
+CONSUMERS = {
+    "api": list(SCHEMA),
+    "train": ["category_name", "brand_name", "sale_price", "sale_qty", "merchant_count"],
+}
+
+
+def read_catalog(path, consumer="api"):
+    """Read only the columns ``consumer`` needs from ``path``, cleaned and typed.
+
+    For the API the raw ``preview_image_list`` is replaced by ``image_url``;
+    the number of rows it failed to parse is in ``df.attrs["image_parse_failures"]``.
+    ``df.attrs["encoded_bytes"]`` maps each dictionary-encoded column to its
+    [object bytes, categorical bytes].
+    """
+    header = pd.read_csv(path, encoding="utf-8", nrows=0).columns
+    usecols = [c for c in CONSUMERS[consumer] if c in header]
+    missing = [c for c in CONSUMERS[consumer] if c not in header and not SCHEMA[c].get("optional")]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+
+    str_cols = [c for c in usecols if SCHEMA[c]["dtype"] in ("str", "category")]
+    if CSV_ENGINE == "pyarrow":
+        # Text columns are typed at parse time: pandas' pyarrow engine casts after
+        # inference, which turns code 001 into "1.0" and a blank into "nan"
+        table = pa_csv.read_csv(path, convert_options=pa_csv.ConvertOptions(
+            include_columns=usecols,
+            column_types={name: pa.string() for name in str_cols},
+            null_values=NA_VALUES,
+            strings_can_be_null=True,
+        ))
+        df = table.to_pandas()[[c for c in header if c in usecols]]  # file order, like read_csv
+        for name in str_cols:
+            df[name] = df[name].where(df[name].notna(), np.nan)
+    else:
+        df = pd.read_csv(path, encoding="utf-8", usecols=usecols, dtype={c: str for c in str_cols})
+
+    encoded = {}
+    for name in usecols:
+        spec = SCHEMA[name]
+        if spec["dtype"] == "datetime":
+            df[name] = pd.to_datetime(df[name], format=spec["format"], errors="coerce").astype("datetime64[ns]")
+        elif spec["dtype"] == "category":
+            before = df[name].memory_usage(index=False, deep=True)
+            df[name] = df[name].astype("category")
+            encoded[name] = [int(before), int(df[name].memory_usage(index=False, deep=True))]
+        elif spec["dtype"] != "str":
+            df[name] = pd.to_numeric(df[name], errors="coerce").fillna(spec["fill"]).astype(spec["dtype"])
+    df.attrs["encoded_bytes"] = encoded
+
+    if "preview_image_list" in df:
+        df["image_url"], failed = extract_image_urls(df.pop("preview_image_list"))
+        df.attrs["image_parse_failures"] = failed
+    return df
+
+
+def memory_report(df):
+    """Lines describing the memory of ``df``: per column, and before/after encoding"""
+    mb = 1024 * 1024
+    lines = []
+    for name, (before, after) in df.attrs.get("encoded_bytes", {}).items():
+        lines.append(f"{name}: {before / mb:.1f} MB as strings -> {after / mb:.1f} MB encoded")
+    usage = df.memory_usage(index=False, deep=True)
+    lines += [f"{name}: {size / mb:.1f} MB" for name, size in usage.items()]
+    lines.append(f"total: {usage.sum() / mb:.1f} MB")
+    return lines
+
+
+# --- preview_image_list -> image_url ---
+def _first_image_url(images):
+    """(first image URL, failed) of a decoded preview_image_list; anything but a list of dicts fails"""
+    if not isinstance(images, list):
+        return "", True
+    if not images:
+        return "", False
+    if not isinstance(images[0], dict):
+        return "", True
+    return images[0].get("medium", images[0].get("small", "")), False
+
+
+def _parse_image_list(img_str):
+    """Slow path: parse one whole preview_image_list, returns (url, failed)"""
+    try:
+        images = json.loads(img_str.replace("'", '"'))
+    except ValueError:
+        return "", True
+    return _first_image_url(images)
+
+
+def _parse_image_lists(items):
+    """Decode the preview_image_list cells in ``items`` with a single json.loads.
+
+    If the batch does not parse, it is split in half until the bad rows are
+    isolated; those go through the slow path. Returns (urls, failed_count).
+    """
+    try:
+        parsed = json.loads("[" + ",".join(items).replace("'", '"') + "]")
+    except ValueError:
+        parsed = None
+    # A cell like "[1], [2]" parses but adds values; bisect it like a bad one
+    if parsed is not None and len(parsed) == len(items):
+        results = [_first_image_url(images) for images in parsed]
+        return [url for url, _ in results], sum(failed for _, failed in results)
+    if len(items) == 1:
+        url, failed = _parse_image_list(items[0])
+        return [url], int(failed)
+    mid = len(items) // 2
+    left, left_failed = _parse_image_lists(items[:mid])
+    right, right_failed = _parse_image_lists(items[mid:])
+    return left + right, left_failed + right_failed
+
+
+def extract_image_urls(images, batch_size=256):
+    """Bulk preview_image_list -> first image URL (medium, then small, then "").
+
+    List-shaped cells are decoded ``batch_size`` rows per json.loads call,
+    others go through the per-row parse. Empty cells give "" and are fine;
+    a cell that does not parse, or is not a list of dicts, counts as failed.
+    Returns (urls, failed_count).
+    """
+    texts = images.where(images.notna(), "").astype(str).tolist()
+    urls = [""] * len(texts)
+    failed = 0
+
+    fast_pos = []
+    for pos, text in enumerate(texts):
+        if text.startswith("["):
+            fast_pos.append(pos)
+        elif text:
+            urls[pos], row_failed = _parse_image_list(text)
+            failed += row_failed
+
+    for i in range(0, len(fast_pos), batch_size):
+        batch_pos = fast_pos[i:i + batch_size]
+        batch, batch_failed = _parse_image_lists([texts[p] for p in batch_pos])
+        for pos, url in zip(batch_pos, batch):
+            urls[pos] = url
+        failed += batch_failed
+
+    return pd.Series(urls, index=images.index, dtype=object), failed
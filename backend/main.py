@@ -1,70 +1,219 @@
-from fastapi import FastAPI, Query
+from fastapi import FastAPI, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+from starlette.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
 import pandas as pd
 import numpy as np
+import base64
+import hmac
 import json
 import os
 import io
-import joblib
-from typing import Optional
+import threading
+import time
+from typing import List, Optional
+
+import cache
+import dataset
+import filters
+import memory
+import model_registry
+import quantiles
+import serialize
+import shared
+import snapshot
+from serialize import as_float, as_int, as_is, as_str, np_rounded, rounded, truncated
 
 # --- Load data on startup ---
 CSV_PATH = os.path.join(os.path.dirname(__file__), "kaspi.csv")
-df: pd.DataFrame = pd.DataFrame()
-model = None
+SNAPSHOT_DIR = os.path.join(os.path.dirname(__file__), ".kaspi_snapshot")
+SHARED_PATH = os.path.join(os.path.dirname(__file__), ".kaspi_shared")
+# KASPI_SHARED=1: worker processes attach to one published dataset instead of
+# each loading their own (set by ``KASPI_WORKERS=N python main.py``)
+SHARED = os.environ.get("KASPI_SHARED") == "1"
+# /api/admin/* needs this token in X-Admin-Token; without one it is served to loopback clients only
+ADMIN_TOKEN = os.environ.get("KASPI_ADMIN_TOKEN")
+# The loaded dataset.Dataset. Endpoints read it once into a local so a
+# request always sees one version even if a reload swaps it meanwhile.
+catalog = None
+models = model_registry.ModelRegistry(
+    os.path.join(os.path.dirname(__file__), "model.joblib"),
+    os.path.join(os.path.dirname(__file__), "encoders.joblib"),
+)
+response_cache = cache.ResponseCache()
+cached = response_cache.endpoint(lambda: catalog.version)
+reload_stats = {"reloads": 0, "running": False, "last_seconds": None, "last_peak_rss_mb": None, "last_error": None}
+_reload_lock = threading.Lock()
 
-def _load_data():
-    global df, model
-    print("Loading CSV...")
-    df_raw = pd.read_csv(CSV_PATH, encoding="utf-8")
-
-    # Clean & type-cast
-    df_raw["sale_price"] = pd.to_numeric(df_raw["sale_price"], errors="coerce").fillna(0).astype(int)
-    df_raw["sale_qty"] = pd.to_numeric(df_raw["sale_qty"], errors="coerce").fillna(0).astype(int)
-    df_raw["sale_amount"] = pd.to_numeric(df_raw["sale_amount"], errors="coerce").fillna(0).astype(np.int64)
-    df_raw["product_rate"] = pd.to_numeric(df_raw["product_rate"], errors="coerce").fillna(0).astype(float)
-    df_raw["review_qty"] = pd.to_numeric(df_raw["review_qty"], errors="coerce").fillna(0).astype(int)
-    df_raw["merchant_count"] = pd.to_numeric(df_raw["merchant_count"], errors="coerce").fillna(0).astype(int)
-    df_raw["amount_abc"] = pd.to_numeric(df_raw["amount_abc"], errors="coerce").fillna(3).astype(int)
-    df_raw["show_order_num"] = pd.to_numeric(df_raw["show_order_num"], errors="coerce").fillna(0).astype(int)
-
-    # Parse dates
-    df_raw["created_dt"] = pd.to_datetime(df_raw["created_dt"], errors="coerce")
-    df_raw["last_sale_date"] = pd.to_datetime(df_raw["last_sale_date"], errors="coerce")
-
-    # Extract first image URL from preview_image_list JSON
-    def extract_image(img_str):
-        if pd.isna(img_str) or not img_str:
-            return ""
-        try:
-            images = json.loads(img_str.replace("'", '"'))
-            if images and isinstance(images, list):
-                return images[0].get("medium", images[0].get("small", ""))
-        except:
-            pass
-        return ""
 
-    df_raw["image_url"] = df_raw["preview_image_list"].apply(extract_image)
+def _load_data():
+    global catalog
+    if SHARED:
+        catalog = _attach_shared()
+        return
+    catalog = dataset.load(CSV_PATH, SNAPSHOT_DIR, 1)
+    catalog.predictions(models.reload())
+
+
+# --- Shared dataset ---
+def _shared_key():
+    """What the shared dataset is built from: the CSV, the model files and this code"""
+    backend = os.path.dirname(os.path.abspath(__file__))
+    return {
+        "csv": snapshot.fingerprint(CSV_PATH, with_hash=False),
+        "model": models.files_fingerprint(),
+        "code": {n: os.stat(os.path.join(backend, n)).st_mtime_ns for n in sorted(os.listdir(backend)) if n.endswith(".py")},
+    }
 
-    df = df_raw
-    print(f"Loaded {len(df)} products")
 
-    # Load ML model if exists
-    model_path = os.path.join(os.path.dirname(__file__), "model.joblib")
-    if os.path.exists(model_path):
-        model = joblib.load(model_path)
-        print("ML model loaded")
+def _build_shared(version):
+    ds = dataset.load(CSV_PATH, SNAPSHOT_DIR, version)
+    sales_model = models.reload()
+    ds.predictions(sales_model)
+    return ds, sales_model
+
+
+def _attach_shared():
+    """The published dataset (publishing it first if it is missing or stale), with its model"""
+    (ds, sales_model), _ = shared.open_shared(SHARED_PATH, _shared_key(), _build_shared)
+    models.adopt(sales_model)
+    return ds
+
+
+# --- Hot reload ---
+def _reload():
+    """Build the next dataset from kaspi.csv beside the current one, then swap it in.
+
+    Requests already running keep the dataset they started with; the old one
+    is freed once they finish. Returns False if a reload is already running.
+    """
+    global catalog
+    if not _reload_lock.acquire(blocking=False):
+        return False
+    reload_stats["running"] = True
+    try:
+        memory.reset_peak_rss()
+        start = time.perf_counter()
+        if SHARED:
+            # The first worker to get here republishes; the others attach to its file
+            new = _attach_shared()
+        else:
+            new = dataset.load(CSV_PATH, SNAPSHOT_DIR, catalog.version + 1)
+            new.predictions(models.get())
+        catalog = new
+        reload_stats["reloads"] += 1
+        reload_stats["last_seconds"] = round(time.perf_counter() - start, 3)
+        peak = memory.peak_rss_mb()
+        reload_stats["last_peak_rss_mb"] = round(peak, 1) if peak is not None else None
+        reload_stats["last_error"] = None
+        print(f"Reloaded dataset v{new.version} in {reload_stats['last_seconds']:.2f}s, "
+              f"peak RSS {reload_stats['last_peak_rss_mb'] or 0:.0f} MB")
+    except Exception as e:
+        # Keep serving the old version if the new file does not load
+        reload_stats["last_error"] = str(e)
+        print(f"Reload failed: {e}")
+    finally:
+        reload_stats["running"] = False
+        _reload_lock.release()
+    return True
+
+
+def _watch_csv(stop, interval):
+    """Reload whenever kaspi.csv changes size or mtime, checked every ``interval`` seconds"""
+    last = snapshot.fingerprint(CSV_PATH, with_hash=False)
+    while not stop.wait(interval):
+        try:
+            current = snapshot.fingerprint(CSV_PATH, with_hash=False)
+        except OSError:
+            continue
+        if current != last:
+            last = current
+            _reload()
+
+
+def _follow_shared(stop, interval):
+    """Attach to every newer shared dataset another worker publishes, checked every ``interval`` seconds"""
+    while not stop.wait(interval):
+        meta = shared.read_meta(SHARED_PATH)  # reads only the file's JSON header
+        if meta is not None and meta["version"] > catalog.version:
+            _reload()
+
+
+# --- Output rows: key -> (column, converter), see serialize.records ---
+NAME_REVENUE_PRODUCTS = {"name": ("category_name", as_is), "revenue": ("revenue", as_int), "products": ("products", as_int)}
+BRAND_SUMMARY = {**NAME_REVENUE_PRODUCTS, "name": ("brand_name", as_is), "avg_price": ("avg_price", as_int)}
+PRODUCT_ROW = {
+    "product_code": ("product_code", as_str),
+    "product_name": ("product_name", as_is),
+    "brand_name": ("brand_name", as_is),
+    "category_name": ("category_name", as_is),
+    "parent_category": ("_category_name", as_is),
+    "sale_price": ("sale_price", as_int),
+    "product_rate": ("product_rate", as_float),
+    "review_qty": ("review_qty", as_int),
+    "sale_qty": ("sale_qty", as_int),
+    "sale_amount": ("sale_amount", as_int),
+    "merchant_count": ("merchant_count", as_int),
+    "amount_abc": ("amount_abc", as_int),
+    "image_url": ("image_url", as_is),
+    "product_url": ("product_url", as_is),
+    "predicted_sales": ("predicted_sales", as_is),
+    "sales_gap": ("sales_gap", as_is),
+}
+COMPARE_ROW = {k: v for k, v in PRODUCT_ROW.items() if k not in ("parent_category", "product_url", "predicted_sales", "sales_gap")}
+SIMILAR_ROW = {
+    "product_name": ("product_name", as_is),
+    "sale_price": ("sale_price", as_int),
+    "sale_qty": ("sale_qty", as_int),
+    "product_rate": ("product_rate", as_float),
+    "image_url": ("image_url", as_is),
+}
+SIMILAR_DETAIL_ROW = {
+    "product_code": ("product_code", as_str),
+    "product_name": ("product_name", as_is),
+    "brand_name": ("brand_name", as_is),
+    "sale_price": ("sale_price", as_int),
+    "product_rate": ("product_rate", as_float),
+    "sale_qty": ("sale_qty", as_int),
+    "image_url": ("image_url", as_is),
+}
 
 
 @asynccontextmanager
 async def lifespan(app):
     _load_data()
+    # Opt-in file watcher: KASPI_RELOAD_INTERVAL=<seconds>
+    interval = float(os.environ.get("KASPI_RELOAD_INTERVAL", "0"))
+    stop = threading.Event()
+    if interval > 0:
+        threading.Thread(target=_watch_csv, args=(stop, interval), daemon=True).start()
+    if SHARED:
+        # An admin reload reaches one worker; the others pick up what it publishes
+        poll = float(os.environ.get("KASPI_SHARED_POLL", "2"))
+        threading.Thread(target=_follow_shared, args=(stop, poll), daemon=True).start()
     yield
+    stop.set()
 
 app = FastAPI(title="Kaspi Analytics API", lifespan=lifespan)
 
+
+def _admin_allowed(request):
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), ADMIN_TOKEN.encode())
+    return request.client is not None and request.client.host in ("127.0.0.1", "::1")
+
+
+# Added before CORS so a refusal still carries the CORS headers
+@app.middleware("http")
+async def admin_guard(request: Request, call_next):
+    if request.url.path.startswith("/api/admin/") and not _admin_allowed(request):
+        return JSONResponse({"error": "Forbidden"}, status_code=403)
+    return await call_next(request)
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -75,7 +224,11 @@ app.add_middleware(
 
 # --- DASHBOARD ---
 @app.get("/api/dashboard")
+@cached
+@serialize.json_endpoint
 def get_dashboard():
+    ds = catalog
+    df = ds.df
     total_products = len(df)
     total_revenue = int(df["sale_amount"].sum())
     total_sold = int(df["sale_qty"].sum())
@@ -94,43 +247,18 @@ def get_dashboard():
     ]
 
     # Top 10 categories by revenue
-    top_cats_rev = (
-        df.groupby("category_name")
-        .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"))
-        .sort_values("revenue", ascending=False)
-        .head(10)
-        .reset_index()
-    )
-    top_categories = [
-        {"name": row["category_name"], "revenue": int(row["revenue"]), "products": int(row["products"])}
-        for _, row in top_cats_rev.iterrows()
-    ]
+    top_cats_rev = ds.aggs.category.sort_values("revenue", ascending=False).head(10)
+    top_categories = serialize.records(top_cats_rev, NAME_REVENUE_PRODUCTS)
 
     # Top 10 brands by revenue
-    top_br_rev = (
-        df.groupby("brand_name")
-        .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"), avg_rating=("product_rate", "mean"))
-        .sort_values("revenue", ascending=False)
-        .head(10)
-        .reset_index()
+    top_br_rev = ds.aggs.brand.sort_values("revenue", ascending=False).head(10)
+    top_brands = serialize.records(
+        top_br_rev, {**NAME_REVENUE_PRODUCTS, "name": ("brand_name", as_is), "avg_rating": ("avg_rating", rounded(2))}
     )
-    top_brands = [
-        {"name": row["brand_name"], "revenue": int(row["revenue"]), "products": int(row["products"]), "avg_rating": round(row["avg_rating"], 2)}
-        for _, row in top_br_rev.iterrows()
-    ]
 
     # Top 10 categories by qty sold
-    top_cats_qty = (
-        df.groupby("category_name")
-        .agg(sold=("sale_qty", "sum"))
-        .sort_values("sold", ascending=False)
-        .head(10)
-        .reset_index()
-    )
-    top_categories_qty = [
-        {"name": row["category_name"], "sold": int(row["sold"])}
-        for _, row in top_cats_qty.iterrows()
-    ]
+    top_cats_qty = ds.aggs.category.sort_values("sold", ascending=False).head(10)
+    top_categories_qty = serialize.records(top_cats_qty, {"name": ("category_name", as_is), "sold": ("sold", as_int)})
 
     # Price distribution (buckets)
     bins = [0, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 5000001]
@@ -145,16 +273,10 @@ def get_dashboard():
     rating_distribution = [{"range": k, "count": int(v)} for k, v in rating_dist.items()]
 
     # Parent category breakdown
-    parent_cats = (
-        df.groupby("_category_name")
-        .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"), sold=("sale_qty", "sum"))
-        .sort_values("revenue", ascending=False)
-        .reset_index()
+    parent_cats = ds.aggs.parent.sort_values("revenue", ascending=False)
+    parent_categories = serialize.records(
+        parent_cats, {**NAME_REVENUE_PRODUCTS, "name": ("_category_name", as_is), "sold": ("sold", as_int)}
     )
-    parent_categories = [
-        {"name": row["_category_name"], "revenue": int(row["revenue"]), "products": int(row["products"]), "sold": int(row["sold"])}
-        for _, row in parent_cats.iterrows()
-    ]
 
     return {
         "kpi": {
@@ -179,6 +301,7 @@ def get_dashboard():
 
 # --- PRODUCTS (paginated, searchable, filterable) ---
 @app.get("/api/products")
+@serialize.json_endpoint
 def get_products(
     page: int = Query(1, ge=1),
     per_page: int = Query(30, ge=1, le=100),
@@ -188,59 +311,54 @@ def get_products(
     abc: Optional[int] = None,
     min_price: Optional[int] = None,
     max_price: Optional[int] = None,
-    sort_by: str = Query("sale_amount", pattern="^(sale_amount|sale_price|product_rate|review_qty|sale_qty|show_order_num)$"),
+    sort_by: str = Query(
+        "sale_amount",
+        pattern="^(sale_amount|sale_price|product_rate|review_qty|sale_qty|show_order_num|predicted_sales|sales_gap)$",
+    ),
     sort_order: str = Query("desc", pattern="^(asc|desc)$"),
+    cursor: Optional[str] = None,
+    underperforming: bool = Query(False, description="Only products selling below their predicted sales"),
 ):
-    filtered = df.copy()
+    ds = catalog
+    df = ds.df
+    preds = ds.predictions(models.get())
+    if preds is None and (sort_by in dataset.PREDICTION_COLUMNS or underperforming):
+        return {"error": "Model not trained yet"}
 
-    if search:
-        search_lower = search.lower()
-        filtered = filtered[
-            filtered["product_name"].str.lower().str.contains(search_lower, na=False)
-            | filtered["brand_name"].str.lower().str.contains(search_lower, na=False)
-        ]
+    mask = filters.filter_mask(
+        df, ds.search_rows(search) if search else None, category, brand, abc, min_price, max_price
+    )
+    if underperforming:
+        below = preds.columns["sales_gap"] < 0
+        mask = below if mask is None else mask & below
+    if sort_by in dataset.PREDICTION_COLUMNS:
+        index, sort_values = preds.sort_index, preds.columns[sort_by]
+    else:
+        index, sort_values = ds.sort_index, df[sort_by].to_numpy()
+    descending = sort_order == "desc"
+    if cursor:
+        # Keyset pagination: continue right after the (sort value, product_code) in the cursor
+        key = _decode_cursor(cursor, sort_by, sort_order)
+        if key is None:
+            return {"error": "Invalid cursor"}
+        boundary = filters.seek(index, sort_by, descending, sort_values, df["product_code"].to_numpy(), key)
+        total, rows = filters.sorted_page(index, sort_by, descending, mask, 0, per_page, boundary)
+    else:
+        start = (page - 1) * per_page
+        total, rows = filters.sorted_page(index, sort_by, descending, mask, start, per_page)
+    page_data = df.iloc[rows]
+    if preds is not None:
+        page_data = page_data.assign(**{col: values[rows] for col, values in preds.columns.items()})
+    else:
+        page_data = page_data.assign(**{col: None for col in dataset.PREDICTION_COLUMNS})
 
-    if category:
-        filtered = filtered[filtered["category_name"] == category]
+    products = serialize.records(page_data, PRODUCT_ROW)
 
-    if brand:
-        filtered = filtered[filtered["brand_name"] == brand]
-
-    if abc is not None:
-        filtered = filtered[filtered["amount_abc"] == abc]
-
-    if min_price is not None:
-        filtered = filtered[filtered["sale_price"] >= min_price]
-
-    if max_price is not None:
-        filtered = filtered[filtered["sale_price"] <= max_price]
-
-    total = len(filtered)
-    ascending = sort_order == "asc"
-    filtered = filtered.sort_values(sort_by, ascending=ascending)
-
-    start = (page - 1) * per_page
-    end = start + per_page
-    page_data = filtered.iloc[start:end]
-
-    products = []
-    for _, row in page_data.iterrows():
-        products.append({
-            "product_code": str(row["product_code"]),
-            "product_name": row["product_name"],
-            "brand_name": row["brand_name"],
-            "category_name": row["category_name"],
-            "parent_category": row["_category_name"],
-            "sale_price": int(row["sale_price"]),
-            "product_rate": float(row["product_rate"]),
-            "review_qty": int(row["review_qty"]),
-            "sale_qty": int(row["sale_qty"]),
-            "sale_amount": int(row["sale_amount"]),
-            "merchant_count": int(row["merchant_count"]),
-            "amount_abc": int(row["amount_abc"]),
-            "image_url": row["image_url"],
-            "product_url": row.get("product_url", ""),
-        })
+    next_cursor = None
+    if len(page_data) == per_page:
+        last = page_data.iloc[-1]
+        code = last["product_code"]
+        next_cursor = _encode_cursor(sort_by, sort_order, last[sort_by], code if isinstance(code, str) else "")
 
     return {
         "products": products,
@@ -248,21 +366,44 @@ def get_products(
         "page": page,
         "per_page": per_page,
         "total_pages": (total + per_page - 1) // per_page,
+        "next_cursor": next_cursor,
     }
 
 
+def _encode_cursor(sort_by, sort_order, value, product_code):
+    payload = json.dumps([sort_by, sort_order, value.item() if hasattr(value, "item") else value, product_code])
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor, sort_by, sort_order):
+    """(sort value, product_code) from a cursor made for this sort, or None"""
+    try:
+        cur_sort_by, cur_sort_order, value, product_code = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        return None
+    if (cur_sort_by, cur_sort_order) != (sort_by, sort_order) or not isinstance(value, (int, float)):
+        return None
+    return value, str(product_code)
+
+
 # --- FILTERS (for dropdowns) ---
 @app.get("/api/filters")
+@cached
+@serialize.json_endpoint
 def get_filters():
-    categories = sorted(df["category_name"].dropna().unique().tolist())
+    # Answered from the dictionaries of the encoded columns (categories are sorted)
+    ds = catalog
+    df = ds.df
+    categories = df["category_name"].cat.categories.tolist()
+    brand_codes = df["brand_name"].cat.codes.to_numpy()
+    brand_counts = np.bincount(brand_codes[brand_codes >= 0], minlength=len(df["brand_name"].cat.categories))
     brands = (
-        df.groupby("brand_name")
-        .size()
+        pd.Series(brand_counts, index=df["brand_name"].cat.categories)
         .sort_values(ascending=False)
         .head(200)
         .index.tolist()
     )
-    parent_categories = sorted(df["_category_name"].dropna().unique().tolist())
+    parent_categories = df["_category_name"].cat.categories.tolist()
     return {
         "categories": categories,
         "brands": brands,
@@ -272,7 +413,10 @@ def get_filters():
 
 # --- CATEGORY ANALYTICS ---
 @app.get("/api/categories/{category_name}")
+@serialize.json_endpoint
 def get_category_analytics(category_name: str):
+    ds = catalog
+    df = ds.df
     cat_df = df[df["category_name"] == category_name]
     if cat_df.empty:
         return {"error": "Category not found"}
@@ -286,17 +430,8 @@ def get_category_analytics(category_name: str):
     avg_merchants = round(float(cat_df["merchant_count"].mean()), 1)
 
     # Top brands in category
-    top_brands = (
-        cat_df.groupby("brand_name")
-        .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"), avg_price=("sale_price", "mean"))
-        .sort_values("revenue", ascending=False)
-        .head(10)
-        .reset_index()
-    )
-    brands_data = [
-        {"name": r["brand_name"], "revenue": int(r["revenue"]), "products": int(r["products"]), "avg_price": int(r["avg_price"])}
-        for _, r in top_brands.iterrows()
-    ]
+    top_brands = ds.aggs.brands_in_category(category_name).sort_values("revenue", ascending=False).head(10)
+    brands_data = serialize.records(top_brands, BRAND_SUMMARY)
 
     # Price histogram
     prices = cat_df["sale_price"].tolist()
@@ -304,10 +439,12 @@ def get_category_analytics(category_name: str):
 
     # Rating vs Sales scatter (sample max 500)
     sample = cat_df.sample(min(500, len(cat_df)))
-    scatter = [
-        {"rating": float(r["product_rate"]), "sales": int(r["sale_qty"]), "price": int(r["sale_price"]), "name": r["product_name"][:40]}
-        for _, r in sample.iterrows()
-    ]
+    scatter = serialize.records(sample, {
+        "rating": ("product_rate", as_float),
+        "sales": ("sale_qty", as_int),
+        "price": ("sale_price", as_int),
+        "name": ("product_name", truncated(40)),
+    })
 
     # ABC breakdown
     abc = cat_df["amount_abc"].value_counts().to_dict()
@@ -331,7 +468,10 @@ def get_category_analytics(category_name: str):
 
 # --- BRAND COMPARISON ---
 @app.get("/api/brands/compare")
+@serialize.json_endpoint
 def compare_brands(brands: str = Query(..., description="Comma-separated brand names")):
+    ds = catalog
+    df = ds.df
     brand_list = [b.strip() for b in brands.split(",")]
     result = []
     for brand_name in brand_list[:5]:
@@ -352,7 +492,10 @@ def compare_brands(brands: str = Query(..., description="Comma-separated brand n
 
 # --- BRAND ANALYTICS ---
 @app.get("/api/brands/{brand_name}")
+@serialize.json_endpoint
 def get_brand_analytics(brand_name: str):
+    ds = catalog
+    df = ds.df
     br_df = df[df["brand_name"] == brand_name]
     if br_df.empty:
         return {"error": "Brand not found"}
@@ -365,31 +508,19 @@ def get_brand_analytics(brand_name: str):
     total_reviews = int(br_df["review_qty"].sum())
 
     # Categories breakdown
-    cats = (
-        br_df.groupby("category_name")
-        .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"))
-        .sort_values("revenue", ascending=False)
-        .head(10)
-        .reset_index()
-    )
-    categories_data = [
-        {"name": r["category_name"], "revenue": int(r["revenue"]), "products": int(r["products"])}
-        for _, r in cats.iterrows()
-    ]
+    cats = ds.aggs.categories_of_brand(brand_name).sort_values("revenue", ascending=False).head(10)
+    categories_data = serialize.records(cats, NAME_REVENUE_PRODUCTS)
 
     # Top products
     top_prods = br_df.sort_values("sale_amount", ascending=False).head(10)
-    top_products = [
-        {
-            "product_name": r["product_name"],
-            "sale_price": int(r["sale_price"]),
-            "sale_qty": int(r["sale_qty"]),
-            "sale_amount": int(r["sale_amount"]),
-            "product_rate": float(r["product_rate"]),
-            "image_url": r["image_url"],
-        }
-        for _, r in top_prods.iterrows()
-    ]
+    top_products = serialize.records(top_prods, {
+        "product_name": ("product_name", as_is),
+        "sale_price": ("sale_price", as_int),
+        "sale_qty": ("sale_qty", as_int),
+        "sale_amount": ("sale_amount", as_int),
+        "product_rate": ("product_rate", as_float),
+        "image_url": ("image_url", as_is),
+    })
 
     return {
         "name": brand_name,
@@ -407,57 +538,38 @@ def get_brand_analytics(brand_name: str):
 
 
 # --- ML PREDICTION ---
+# Defaults of /api/predict, also used for fields missing from batch rows
+PREDICT_DEFAULTS = {"category": "Смартфоны", "brand": "Apple", "price": 100000, "merchants": 10}
+MAX_BATCH_ROWS = 100000
+
+
 @app.post("/api/predict")
+@serialize.json_endpoint
 def predict_sales(data: dict):
-    global model
-    model_path = os.path.join(os.path.dirname(__file__), "model.joblib")
-    encoders_path = os.path.join(os.path.dirname(__file__), "encoders.joblib")
-
-    if not os.path.exists(model_path):
+    ds = catalog
+    df = ds.df
+    sales_model = models.get()
+    if sales_model is None:
         return {"error": "Model not trained yet"}
 
-    model = joblib.load(model_path)
-    encoders = joblib.load(encoders_path)
-
-    category = data.get("category", "Смартфоны")
-    brand = data.get("brand", "Apple")
-    price = data.get("price", 100000)
-    merchants = data.get("merchants", 10)
+    category = data.get("category", PREDICT_DEFAULTS["category"])
+    brand = data.get("brand", PREDICT_DEFAULTS["brand"])
+    price = data.get("price", PREDICT_DEFAULTS["price"])
+    merchants = data.get("merchants", PREDICT_DEFAULTS["merchants"])
 
-    cat_enc = encoders["category"]
-    brand_enc = encoders["brand"]
-
-    cat_val = cat_enc.transform([category])[0] if category in cat_enc.classes_ else 0
-    brand_val = brand_enc.transform([brand])[0] if brand in brand_enc.classes_ else 0
-
-    features = np.array([[cat_val, brand_val, price, merchants]])
-    predicted_sales = max(0, int(np.expm1(model.predict(features)[0])))
+    predicted_sales = sales_model.predict(category, brand, price, merchants)
 
     # Find similar products
-    similar = df[
-        (df["category_name"] == category) &
-        (df["sale_price"].between(price * 0.7, price * 1.3))
-    ].sort_values("sale_qty", ascending=False).head(5)
-
-    similar_products = [
-        {
-            "product_name": r["product_name"],
-            "sale_price": int(r["sale_price"]),
-            "sale_qty": int(r["sale_qty"]),
-            "product_rate": float(r["product_rate"]),
-            "image_url": r["image_url"],
+    similar = df.iloc[ds.similar_products(category, price, 0.3, 5)]
+    similar_products = serialize.records(similar, SIMILAR_ROW)
+
+    # Price recommendation (None for a category without products)
+    price_recommendation = None
+    if len(ds.quantiles.values("sale_price", category=category)):
+        price_recommendation = {
+            key: int(ds.quantiles.quantile("sale_price", q, category=category))
+            for key, q in (("min", 0.1), ("median", 0.5), ("max", 0.9), ("optimal", 0.4))
         }
-        for _, r in similar.iterrows()
-    ]
-
-    # Price recommendation
-    cat_prices = df[df["category_name"] == category]["sale_price"]
-    price_recommendation = {
-        "min": int(cat_prices.quantile(0.1)),
-        "median": int(cat_prices.median()),
-        "max": int(cat_prices.quantile(0.9)),
-        "optimal": int(cat_prices.quantile(0.4)),
-    }
 
     return {
         "predicted_sales": predicted_sales,
@@ -466,48 +578,112 @@ def predict_sales(data: dict):
     }
 
 
+class BatchRow(BaseModel):
+    """One row of /api/predict/batch; anything but these scalar fields is a 422"""
+    model_config = ConfigDict(extra="forbid")
+
+    category: Optional[str] = None
+    brand: Optional[str] = None
+    price: float
+    merchants: Optional[float] = None
+
+
+_batch_rows = TypeAdapter(List[BatchRow])
+
+
+def _batch_frame(body, content_type):
+    """(rows frame, None) from a JSON array or CSV body, or (None, error message).
+
+    JSON rows that do not fit BatchRow raise RequestValidationError.
+    """
+    if "csv" in content_type:
+        try:
+            rows = pd.read_csv(io.BytesIO(body), dtype={"category": str, "brand": str})
+        except (ValueError, pd.errors.ParserError) as e:
+            return None, f"Could not parse CSV: {e}"
+        # A misnamed header would otherwise be predicted from the defaults without a word
+        unknown = [str(c) for c in rows.columns if c not in PREDICT_DEFAULTS]
+        if unknown:
+            return None, f"Unknown fields: {', '.join(unknown)} (expected {', '.join(PREDICT_DEFAULTS)})"
+        if len(rows) and "price" not in rows:
+            return None, "price is required"
+    else:
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return None, "Body must be a JSON array or CSV"
+        if isinstance(data, dict):
+            data = data.get("rows")
+        try:
+            parsed = _batch_rows.validate_python(data)
+        except ValidationError as e:
+            raise RequestValidationError([{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)])
+        rows = pd.DataFrame({col: [getattr(r, col) for r in parsed] for col in PREDICT_DEFAULTS})
+    # No default price: a CSV row without one fails the number check instead
+    for col, default in PREDICT_DEFAULTS.items():
+        if col != "price":
+            rows[col] = rows[col].fillna(default) if col in rows else default
+    return rows, None
+
+
+def _predict_batch(body, content_type):
+    sales_model = models.get()
+    if sales_model is None:
+        return {"error": "Model not trained yet"}
+    rows, error = _batch_frame(body, content_type)
+    if error:
+        return {"error": error}
+    if len(rows) > MAX_BATCH_ROWS:
+        return {"error": f"At most {MAX_BATCH_ROWS} rows per batch"}
+    if not len(rows):
+        return {"predictions": [], "count": 0, "unknown_categories": 0, "unknown_brands": 0}
+
+    prices = pd.to_numeric(rows["price"], errors="coerce")
+    merchants = pd.to_numeric(rows["merchants"], errors="coerce")
+    bad = np.flatnonzero((prices.isna() | merchants.isna()).to_numpy())
+    if len(bad):
+        return {"error": f"price and merchants must be numbers (rows {', '.join(map(str, bad[:10].tolist()))})"}
+
+    predicted, unknown_categories, unknown_brands = sales_model.predict_many(
+        rows["category"].tolist(), rows["brand"].tolist(), prices.to_numpy(), merchants.to_numpy()
+    )
+    return {
+        "predictions": predicted.tolist(),
+        "count": len(rows),
+        "unknown_categories": unknown_categories,
+        "unknown_brands": unknown_brands,
+    }
+
+
+@app.post("/api/predict/batch")
+@serialize.json_endpoint
+async def predict_batch(request: Request):
+    """Predict many rows at once: a JSON array of {category, brand, price, merchants}
+    (or {"rows": [...]}) or a CSV with those columns sent as text/csv. Every row
+    needs a price; category, brand and merchants default like /api/predict."""
+    body = await request.body()
+    return await run_in_threadpool(_predict_batch, body, request.headers.get("content-type", ""))
+
+
 # --- PRODUCT DETAIL ---
 @app.get("/api/product/{product_code}")
+@serialize.json_endpoint
 def get_product_detail(product_code: str):
-    prod = df[df["product_code"].astype(str) == product_code]
-    if prod.empty:
+    ds = catalog
+    df = ds.df
+    pos = ds.product_index.get(product_code)
+    if pos is None:
         return {"error": "Product not found"}
-    row = prod.iloc[0]
+    row = df.iloc[pos]
     
     # Similar products (same category, similar price)
     price = int(row["sale_price"])
-    similar = df[
-        (df["category_name"] == row["category_name"]) &
-        (df["product_code"].astype(str) != product_code) &
-        (df["sale_price"].between(price * 0.5, price * 1.5))
-    ].sort_values("sale_qty", ascending=False).head(8)
-    
-    similar_products = [
-        {
-            "product_code": str(r["product_code"]),
-            "product_name": r["product_name"],
-            "brand_name": r["brand_name"],
-            "sale_price": int(r["sale_price"]),
-            "product_rate": float(r["product_rate"]),
-            "sale_qty": int(r["sale_qty"]),
-            "image_url": r["image_url"],
-        }
-        for _, r in similar.iterrows()
-    ]
+    similar = df.iloc[ds.similar_products(row["category_name"], price, 0.5, 8, exclude=product_code)]
+    similar_products = serialize.records(similar, SIMILAR_DETAIL_ROW)
     
     # ML prediction
-    predicted_sales = None
-    model_path = os.path.join(os.path.dirname(__file__), "model.joblib")
-    encoders_path = os.path.join(os.path.dirname(__file__), "encoders.joblib")
-    if os.path.exists(model_path) and os.path.exists(encoders_path):
-        mdl = joblib.load(model_path)
-        encoders = joblib.load(encoders_path)
-        cat_enc = encoders["category"]
-        brand_enc = encoders["brand"]
-        cat_val = cat_enc.transform([row["category_name"]])[0] if row["category_name"] in cat_enc.classes_ else 0
-        brand_val = brand_enc.transform([row["brand_name"]])[0] if row["brand_name"] in brand_enc.classes_ else 0
-        features = np.array([[cat_val, brand_val, price, int(row["merchant_count"])]])
-        predicted_sales = max(0, int(np.expm1(mdl.predict(features)[0])))
+    preds = ds.predictions(models.get())
+    predicted_sales = int(preds.columns["predicted_sales"][pos]) if preds is not None else None
     
     return {
         "product_code": str(row["product_code"]),
@@ -533,19 +709,10 @@ def get_product_detail(product_code: str):
 
 # --- NICHE SEARCH ---
 @app.get("/api/niches")
+@serialize.json_endpoint
 def get_niches(min_revenue: int = Query(0), max_merchants: int = Query(1000)):
-    cat_stats = (
-        df.groupby("category_name")
-        .agg(
-            revenue=("sale_amount", "sum"),
-            products=("product_code", "count"),
-            sold=("sale_qty", "sum"),
-            avg_price=("sale_price", "mean"),
-            avg_merchants=("merchant_count", "mean"),
-            avg_rating=("product_rate", "mean"),
-        )
-        .reset_index()
-    )
+    ds = catalog
+    cat_stats = ds.aggs.category.copy()
     cat_stats["avg_price"] = cat_stats["avg_price"].astype(int)
     cat_stats["avg_merchants"] = cat_stats["avg_merchants"].round(1)
     cat_stats["avg_rating"] = cat_stats["avg_rating"].round(2)
@@ -566,69 +733,61 @@ def get_niches(min_revenue: int = Query(0), max_merchants: int = Query(1000)):
     ).round(3)
     filtered = filtered.sort_values("niche_score", ascending=False)
     
-    niches = [
-        {
-            "name": r["category_name"],
-            "revenue": int(r["revenue"]),
-            "products": int(r["products"]),
-            "sold": int(r["sold"]),
-            "avg_price": int(r["avg_price"]),
-            "avg_merchants": float(r["avg_merchants"]),
-            "avg_rating": float(r["avg_rating"]),
-            "niche_score": float(r["niche_score"]),
-        }
-        for _, r in filtered.head(200).iterrows()
-    ]
+    niches = serialize.records(filtered.head(200), {
+        **NAME_REVENUE_PRODUCTS,
+        "sold": ("sold", as_int),
+        "avg_price": ("avg_price", as_int),
+        "avg_merchants": ("avg_merchants", as_float),
+        "avg_rating": ("avg_rating", as_float),
+        "niche_score": ("niche_score", as_float),
+    })
     
     return {"niches": niches, "total": len(filtered)}
 
 
 # --- COMPETITION ANALYSIS ---
 @app.get("/api/competition")
+@cached
+@serialize.json_endpoint
 def get_competition():
-    cat_comp = (
-        df.groupby("category_name")
-        .agg(
-            avg_merchants=("merchant_count", "mean"),
-            max_merchants=("merchant_count", "max"),
-            products=("product_code", "count"),
-            revenue=("sale_amount", "sum"),
-            avg_price=("sale_price", "mean"),
-        )
-        .reset_index()
-    )
+    ds = catalog
+    df = ds.df
+    cat_comp = ds.aggs.category.copy()
     cat_comp["avg_merchants"] = cat_comp["avg_merchants"].round(1)
     cat_comp["avg_price"] = cat_comp["avg_price"].astype(int)
     
     # Top categories by competition
     top_competition = cat_comp.sort_values("avg_merchants", ascending=False).head(20)
-    top_comp_data = [
-        {"name": r["category_name"], "avg_merchants": float(r["avg_merchants"]), "products": int(r["products"]), "revenue": int(r["revenue"]), "avg_price": int(r["avg_price"])}
-        for _, r in top_competition.iterrows()
-    ]
+    top_comp_data = serialize.records(top_competition, {
+        "name": ("category_name", as_is),
+        "avg_merchants": ("avg_merchants", as_float),
+        "products": ("products", as_int),
+        "revenue": ("revenue", as_int),
+        "avg_price": ("avg_price", as_int),
+    })
     
     # Monopoly products (1 merchant, high sales)
     monopolies = df[df["merchant_count"] == 1].sort_values("sale_amount", ascending=False).head(20)
-    monopoly_data = [
-        {
-            "product_code": str(r["product_code"]),
-            "product_name": r["product_name"],
-            "brand_name": r["brand_name"],
-            "category_name": r["category_name"],
-            "sale_price": int(r["sale_price"]),
-            "sale_qty": int(r["sale_qty"]),
-            "sale_amount": int(r["sale_amount"]),
-            "product_rate": float(r["product_rate"]),
-            "image_url": r["image_url"],
-        }
-        for _, r in monopolies.iterrows()
-    ]
+    monopoly_data = serialize.records(monopolies, {
+        "product_code": ("product_code", as_str),
+        "product_name": ("product_name", as_is),
+        "brand_name": ("brand_name", as_is),
+        "category_name": ("category_name", as_is),
+        "sale_price": ("sale_price", as_int),
+        "sale_qty": ("sale_qty", as_int),
+        "sale_amount": ("sale_amount", as_int),
+        "product_rate": ("product_rate", as_float),
+        "image_url": ("image_url", as_is),
+    })
     
     # Scatter: avg_price vs avg_merchants per category
-    scatter = [
-        {"name": r["category_name"], "avg_price": int(r["avg_price"]), "avg_merchants": float(r["avg_merchants"]), "revenue": int(r["revenue"]), "products": int(r["products"])}
-        for _, r in cat_comp.iterrows()
-    ]
+    scatter = serialize.records(cat_comp, {
+        "name": ("category_name", as_is),
+        "avg_price": ("avg_price", as_int),
+        "avg_merchants": ("avg_merchants", as_float),
+        "revenue": ("revenue", as_int),
+        "products": ("products", as_int),
+    })
     
     # Merchant distribution
     bins = [0, 1, 2, 3, 5, 10, 20, 50, 100, 500]
@@ -646,26 +805,29 @@ def get_competition():
 
 # --- TIME ANALYSIS ---
 @app.get("/api/time-analysis")
+@cached
+@serialize.json_endpoint
 def get_time_analysis():
     # Products added by month
+    ds = catalog
+    df = ds.df
     added = df.dropna(subset=["created_dt"]).copy()
     added["month"] = added["created_dt"].dt.to_period("M").astype(str)
     by_month = added.groupby("month").agg(
         products=("product_code", "count"),
         revenue=("sale_amount", "sum"),
     ).reset_index().sort_values("month")
-    products_by_month = [
-        {"month": r["month"], "products": int(r["products"]), "revenue": int(r["revenue"])}
-        for _, r in by_month.iterrows()
-    ]
+    products_by_month = serialize.records(
+        by_month, {"month": ("month", as_is), "products": ("products", as_int), "revenue": ("revenue", as_int)}
+    )
     
     # Weak products (sale_qty <= median/4 = low performers)
-    sale_median = df["sale_qty"].median()
+    sale_median = ds.quantiles.quantile("sale_qty", 0.5)
     weak_threshold = max(2, int(sale_median / 4))
     weak = df[df["sale_qty"] <= weak_threshold]
     strong = df[df["sale_qty"] > weak_threshold]
     
-    weak_by_cat = weak.groupby("category_name").size().sort_values(ascending=False).head(15)
+    weak_by_cat = weak.groupby("category_name", observed=True).size().sort_values(ascending=False).head(15)
     dead_categories = [{"name": k, "count": int(v)} for k, v in weak_by_cat.items()]
     
     # Sales volume distribution
@@ -694,7 +856,11 @@ def get_time_analysis():
 
 # --- CORRELATION ---
 @app.get("/api/correlation")
+@cached
+@serialize.json_endpoint
 def get_correlation():
+    ds = catalog
+    df = ds.df
     cols = ["sale_price", "product_rate", "review_qty", "sale_qty", "merchant_count", "sale_amount"]
     labels_map = {
         "sale_price": "Цена",
@@ -724,66 +890,65 @@ def get_correlation():
 
 # --- GLOBAL SEARCH ---
 @app.get("/api/search")
+@serialize.json_endpoint
 def global_search(q: str = Query(..., min_length=2)):
-    q_lower = q.lower()
-    
     # Search products (limit 10)
-    prod_matches = df[
-        df["product_name"].str.lower().str.contains(q_lower, na=False)
-    ].sort_values("sale_amount", ascending=False).head(10)
-    products = [
-        {
-            "product_code": str(r["product_code"]),
-            "product_name": r["product_name"],
-            "sale_price": int(r["sale_price"]),
-            "image_url": r["image_url"],
-            "type": "product",
-        }
-        for _, r in prod_matches.iterrows()
-    ]
+    ds = catalog
+    df = ds.df
+    prod_matches = df.iloc[ds.name_index.search(q)].sort_values("sale_amount", ascending=False).head(10)
+    products = serialize.records(prod_matches, {
+        "product_code": ("product_code", as_str),
+        "product_name": ("product_name", as_is),
+        "sale_price": ("sale_price", as_int),
+        "image_url": ("image_url", as_is),
+    })
+    for p in products:
+        p["type"] = "product"
     
-    # Search categories
-    all_cats = df["category_name"].dropna().unique()
-    cat_matches = [c for c in all_cats if q_lower in c.lower()][:8]
-    categories = [{"name": c, "type": "category"} for c in cat_matches]
-    
-    # Search brands
-    all_brands = df["brand_name"].dropna().unique()
-    brand_matches = [b for b in all_brands if q_lower in b.lower()][:8]
-    brands = [{"name": b, "type": "brand"} for b in brand_matches]
+    # Search categories and brands (word-prefix, top 8 by revenue)
+    categories = [{"name": ds.category_suggester.names[i], "type": "category"} for i in ds.category_suggester.suggest(q)]
+    brands = [{"name": ds.brand_suggester.names[i], "type": "brand"} for i in ds.brand_suggester.suggest(q)]
     
     return {"products": products, "categories": categories, "brands": brands}
 
 
+# --- TYPEAHEAD SUGGESTIONS ---
+@app.get("/api/suggest")
+@serialize.json_endpoint
+def suggest(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(8, ge=1, le=50),
+    rank_by: str = Query("revenue", pattern="^(revenue|products)$"),
+):
+    ds = catalog
+    def matches(suggester, kind):
+        return [
+            {
+                "name": suggester.names[i],
+                "type": kind,
+                "revenue": int(suggester.weights["revenue"][i]),
+                "products": int(suggester.weights["products"][i]),
+            }
+            for i in suggester.suggest(q, limit, rank_by)
+        ]
+
+    return {"categories": matches(ds.category_suggester, "category"), "brands": matches(ds.brand_suggester, "brand")}
+
+
 # --- PRODUCT COMPARISON ---
 @app.get("/api/products/compare")
+@serialize.json_endpoint
 def compare_products(codes: str = Query(..., description="Comma-separated product codes")):
+    ds = catalog
+    df = ds.df
     code_list = [c.strip() for c in codes.split(",")][:5]
-    result = []
-    for code in code_list:
-        prod = df[df["product_code"].astype(str) == code]
-        if prod.empty:
-            continue
-        r = prod.iloc[0]
-        result.append({
-            "product_code": str(r["product_code"]),
-            "product_name": r["product_name"],
-            "brand_name": r["brand_name"],
-            "category_name": r["category_name"],
-            "sale_price": int(r["sale_price"]),
-            "product_rate": float(r["product_rate"]),
-            "review_qty": int(r["review_qty"]),
-            "sale_qty": int(r["sale_qty"]),
-            "sale_amount": int(r["sale_amount"]),
-            "merchant_count": int(r["merchant_count"]),
-            "amount_abc": int(r["amount_abc"]),
-            "image_url": r["image_url"],
-        })
-    return result
+    positions = [ds.product_index[code] for code in code_list if code in ds.product_index]
+    return serialize.records(df.iloc[positions], COMPARE_ROW)
 
 
 # --- EXPORT ---
 @app.get("/api/export/products")
+@serialize.json_endpoint
 def export_products(
     format: str = Query("csv", pattern="^(csv|xlsx)$"),
     search: Optional[str] = None,
@@ -791,22 +956,13 @@ def export_products(
     brand: Optional[str] = None,
     abc: Optional[int] = None,
 ):
-    filtered = df.copy()
-    if search:
-        search_lower = search.lower()
-        filtered = filtered[
-            filtered["product_name"].str.lower().str.contains(search_lower, na=False)
-            | filtered["brand_name"].str.lower().str.contains(search_lower, na=False)
-        ]
-    if category:
-        filtered = filtered[filtered["category_name"] == category]
-    if brand:
-        filtered = filtered[filtered["brand_name"] == brand]
-    if abc is not None:
-        filtered = filtered[filtered["amount_abc"] == abc]
+    ds = catalog
+    df = ds.df
+    mask = filters.filter_mask(df, ds.search_rows(search) if search else None, category, brand, abc)
+    rows = np.flatnonzero(mask)[:50000] if mask is not None else np.arange(min(len(df), 50000))
     
     export_cols = ["product_name", "brand_name", "category_name", "sale_price", "product_rate", "review_qty", "sale_qty", "sale_amount", "merchant_count"]
-    export_df = filtered[export_cols].head(50000)
+    export_df = df.iloc[rows][export_cols]
     export_df.columns = ["Название", "Бренд", "Категория", "Цена", "Рейтинг", "Отзывы", "Продано", "Выручка", "Продавцы"]
     
     if format == "xlsx":
@@ -824,9 +980,38 @@ def export_products(
 
 
 # --- PRICE CALCULATOR ---
+def _price_edges(prices, n_bins, binning):
+    """``n_bins + 1`` integer segment edges over ``prices``.
+
+    linear: equal widths; log: equal price ratios; quantile: equal product
+    counts. Edges that coincide after truncation to int are merged for log and
+    quantile bins, so those can return fewer segments.
+    """
+    min_p, max_p = int(prices.min()), int(prices.max())
+    if max_p <= min_p:
+        max_p = min_p + 1000
+    if binning == "linear":
+        return np.linspace(min_p, max_p, n_bins + 1).astype(int)
+    if binning == "log":
+        edges = np.geomspace(max(min_p, 1), max_p, n_bins + 1).astype(int)
+        edges[0] = min_p
+    else:
+        edges = np.quantile(prices, np.linspace(0, 1, n_bins + 1)).astype(int)
+        edges[0], edges[-1] = min_p, max_p
+    return np.unique(edges)
+
+
 @app.get("/api/price-calculator")
-def price_calculator(category: str = Query(...), brand: str = Query("")):
-    cat_df = df[df["category_name"] == category].copy()
+@serialize.json_endpoint
+def price_calculator(
+    category: str = Query(...),
+    brand: str = Query(""),
+    n_bins: int = Query(12, ge=1, le=100),
+    binning: str = Query("linear", pattern="^(linear|log|quantile)$"),
+):
+    ds = catalog
+    df = ds.df
+    cat_df = df[df["category_name"] == category]
     if brand:
         brand_df = cat_df[cat_df["brand_name"] == brand]
     else:
@@ -835,61 +1020,64 @@ def price_calculator(category: str = Query(...), brand: str = Query("")):
     if len(cat_df) == 0:
         return {"error": "Категория не найдена"}
 
-    # Price distribution in category - split into 12 bins
-    prices = cat_df["sale_price"]
-    min_p, max_p = int(prices.min()), int(prices.max())
-    if max_p <= min_p:
-        max_p = min_p + 1000
-
-    n_bins = 12
-    bin_edges = np.linspace(min_p, max_p, n_bins + 1).astype(int)
-    
-    price_segments = []
-    for i in range(n_bins):
-        low, high = int(bin_edges[i]), int(bin_edges[i + 1])
-        seg = cat_df[(cat_df["sale_price"] >= low) & (cat_df["sale_price"] < high)]
-        products = len(seg)
-        revenue = int(seg["sale_amount"].sum())
-        avg_merchants = round(float(seg["merchant_count"].mean()), 1) if products > 0 else 0
-        avg_rating = round(float(seg["product_rate"].mean()), 2) if products > 0 else 0
-        total_sold = int(seg["sale_qty"].sum()) if products > 0 else 0
-        
-        price_segments.append({
+    # Price distribution in category: every product falls in [low, high) of one
+    # segment, the last one [low, high] so the most expensive product is counted too
+    prices = cat_df["sale_price"].to_numpy()
+    bin_edges = _price_edges(prices, n_bins, binning)
+    n_segments = len(bin_edges) - 1
+    # side="right" picks the last of repeated edges, leaving empty [e, e) segments empty
+    segment = np.minimum(np.searchsorted(bin_edges, prices, side="right") - 1, n_segments - 1)
+    inside = segment >= 0
+    segment = segment[inside]
+
+    def segment_sums(column):
+        return np.bincount(segment, weights=cat_df[column].to_numpy()[inside], minlength=n_segments)
+
+    counts = np.bincount(segment, minlength=n_segments)
+    revenue = segment_sums("sale_amount")
+    sold = segment_sums("sale_qty")
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg_merchants = np.where(counts > 0, segment_sums("merchant_count") / counts, 0)
+    # Float ratings are averaged per contiguous run of the rows grouped by segment:
+    # np.mean sums a run in the same order as Series.mean, so the rounding matches
+    ratings = cat_df["product_rate"].to_numpy()[inside][np.argsort(segment, kind="stable")]
+    bounds = np.concatenate([[0], np.cumsum(counts)]).tolist()
+    avg_rating = np.array([ratings[a:b].mean() if b > a else 0.0 for a, b in zip(bounds[:-1], bounds[1:])])
+
+    lows, highs = bin_edges[:-1].tolist(), bin_edges[1:].tolist()
+    price_segments = [
+        {
             "range": f"{low//1000}K-{high//1000}K" if high >= 1000 else f"{low}-{high}",
             "low": low,
             "high": high,
             "products": products,
-            "revenue": revenue,
-            "avg_merchants": avg_merchants,
-            "avg_rating": avg_rating,
-            "total_sold": total_sold,
-        })
+            "revenue": seg_revenue,
+            "avg_merchants": round(merchants, 1) if products > 0 else 0,
+            "avg_rating": round(rating, 2) if products > 0 else 0,
+            "total_sold": seg_sold,
+        }
+        for low, high, products, seg_revenue, merchants, rating, seg_sold in zip(
+            lows, highs, counts.tolist(), revenue.astype(np.int64).tolist(),
+            avg_merchants.tolist(), avg_rating.tolist(), sold.astype(np.int64).tolist(),
+        )
+    ]
 
-    # Find gaps (segments with low competition but demand in nearby segments)
-    gaps = []
-    for i, seg in enumerate(price_segments):
-        # Nearby demand: sum revenue from adjacent segments
-        nearby_revenue = 0
-        nearby_products = 0
-        for j in range(max(0, i - 1), min(n_bins, i + 2)):
-            nearby_revenue += price_segments[j]["revenue"]
-            nearby_products += price_segments[j]["products"]
-        
-        # Score: low products + high nearby revenue = good gap
-        if nearby_products > 0:
-            competition_score = seg["products"] / nearby_products
-        else:
-            competition_score = 1
-        
-        demand_score = nearby_revenue
-        gap_score = (1 - competition_score) * (demand_score / max(1, max(s["revenue"] for s in price_segments)))
-        
-        gaps.append({
-            **seg,
-            "gap_score": round(gap_score, 3),
-        })
-    
-    gaps.sort(key=lambda x: x["gap_score"], reverse=True)
+    # Find gaps (segments with low competition but demand in nearby segments):
+    # few products of their own, high revenue in the segment and its two neighbours
+    def nearby(values):
+        padded = np.pad(values, 1)
+        return padded[:-2] + padded[1:-1] + padded[2:]
+
+    seg_revenue = revenue.astype(np.int64)
+    nearby_revenue = nearby(seg_revenue)
+    nearby_products = nearby(counts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        competition_score = np.where(nearby_products > 0, counts / nearby_products, 1)
+    gap_score = (1 - competition_score) * (nearby_revenue / max(1, int(seg_revenue.max())))
+    gap_score = [round(score, 3) for score in gap_score.tolist()]
+    # Stable, like sorting the segments by score: ties keep the lower segment first
+    order = sorted(range(n_segments), key=gap_score.__getitem__, reverse=True)
+    gaps = [{**price_segments[i], "gap_score": gap_score[i]} for i in order[:5]]
 
     # Brand stats in this category
     brand_stats = None
@@ -908,22 +1096,15 @@ def price_calculator(category: str = Query(...), brand: str = Query("")):
     cat_stats = {
         "total_products": len(cat_df),
         "avg_price": int(cat_df["sale_price"].mean()),
-        "median_price": int(cat_df["sale_price"].median()),
+        "median_price": int(ds.quantiles.quantile("sale_price", 0.5, category=category)),
         "total_revenue": int(cat_df["sale_amount"].sum()),
         "avg_merchants": round(float(cat_df["merchant_count"].mean()), 1),
         "avg_rating": round(float(cat_df["product_rate"].mean()), 2),
     }
 
     # Top 5 competitors (brands) in category
-    top_brands = (cat_df.groupby("brand_name")
-                  .agg(revenue=("sale_amount", "sum"), products=("product_code", "count"), avg_price=("sale_price", "mean"))
-                  .sort_values("revenue", ascending=False)
-                  .head(5)
-                  .reset_index())
-    competitors = [
-        {"name": r["brand_name"], "revenue": int(r["revenue"]), "products": int(r["products"]), "avg_price": int(r["avg_price"])}
-        for _, r in top_brands.iterrows()
-    ]
+    top_brands = ds.aggs.brands_in_category(category).sort_values("revenue", ascending=False).head(5)
+    competitors = serialize.records(top_brands, BRAND_SUMMARY)
 
     return {
         "category": category,
@@ -931,38 +1112,67 @@ def price_calculator(category: str = Query(...), brand: str = Query("")):
         "cat_stats": cat_stats,
         "brand_stats": brand_stats,
         "price_segments": price_segments,
-        "gaps": gaps[:5],
+        "gaps": gaps,
         "competitors": competitors,
     }
 
 
+# --- QUANTILES ---
+DEFAULT_QUANTILES = [round(i * 0.05, 2) for i in range(21)]
+
+
+@app.get("/api/quantiles")
+@serialize.json_endpoint
+def get_quantiles(
+    column: str = Query("sale_price", pattern="^(" + "|".join(quantiles.COLUMNS) + ")$"),
+    category: str = Query(""),
+    brand: str = Query(""),
+    q: str = Query("", description="Comma-separated quantiles in 0..1, every 0.05 by default"),
+):
+    """Percentiles of a column for a category, a brand, both, or the whole catalog"""
+    ds = catalog
+    try:
+        qs = [float(x) for x in q.split(",") if x.strip()] if q else DEFAULT_QUANTILES
+    except ValueError:
+        return {"error": "q must be comma-separated numbers"}
+    if not qs or len(qs) > 101 or not all(0 <= x <= 1 for x in qs):
+        return {"error": "q must list 1 to 101 numbers between 0 and 1"}
+
+    values = ds.quantiles.values(column, category or None, brand or None)
+    if len(values) == 0:
+        return {"error": "No products found"}
+    return {
+        "column": column,
+        "category": category,
+        "brand": brand,
+        "count": len(values),
+        "quantiles": [{"q": x, "value": quantiles.quantile_of_sorted(values, x)} for x in qs],
+    }
+
+
 # --- ABC PARETO ---
 @app.get("/api/abc-pareto")
-def abc_pareto():
-    # Sort all products by revenue descending
-    sorted_df = df[["product_name", "brand_name", "category_name", "sale_amount", "sale_qty", "sale_price"]].copy()
-    sorted_df = sorted_df.sort_values("sale_amount", ascending=False).reset_index(drop=True)
-    
-    total_revenue = sorted_df["sale_amount"].sum()
-    sorted_df["cumulative_revenue"] = sorted_df["sale_amount"].cumsum()
-    sorted_df["cumulative_pct"] = (sorted_df["cumulative_revenue"] / total_revenue * 100).round(2)
-    sorted_df["product_pct"] = ((sorted_df.index + 1) / len(sorted_df) * 100).round(4)
-
-    # Pareto curve - sample ~200 points for the chart
-    n = len(sorted_df)
-    step = max(1, n // 200)
-    pareto_points = []
-    for i in range(0, n, step):
-        pareto_points.append({
-            "product_pct": round(float(sorted_df.iloc[i]["product_pct"]), 2),
-            "revenue_pct": round(float(sorted_df.iloc[i]["cumulative_pct"]), 2),
-        })
+@cached
+@serialize.json_endpoint
+def abc_pareto(resolution: int = Query(200, ge=10, le=5000)):
+    # Products by revenue descending and their running revenue, kept per data version
+    ds = catalog
+    df = ds.df
+    pareto = ds.pareto
+    total_revenue = pareto.total
+
+    # Pareto curve - about ``resolution`` points for the chart
+    product_pct, revenue_pct = pareto.curve(resolution)
+    pareto_points = [
+        {"product_pct": round(p, 2), "revenue_pct": round(r, 2)}
+        for p, r in zip(product_pct.tolist(), revenue_pct.tolist())
+    ]
     # Always include last point
     pareto_points.append({"product_pct": 100.0, "revenue_pct": 100.0})
 
     # Key thresholds
-    pct_80 = sorted_df[sorted_df["cumulative_pct"] >= 80].iloc[0]["product_pct"] if len(sorted_df[sorted_df["cumulative_pct"] >= 80]) > 0 else 100
-    pct_95 = sorted_df[sorted_df["cumulative_pct"] >= 95].iloc[0]["product_pct"] if len(sorted_df[sorted_df["cumulative_pct"] >= 95]) > 0 else 100
+    pct_80 = pareto.threshold(80)
+    pct_95 = pareto.threshold(95)
     
     # ABC breakdown
     abc_counts = df["amount_abc"].value_counts().sort_index()
@@ -984,19 +1194,17 @@ def abc_pareto():
         })
 
     # Top 10 products by revenue
-    top10 = sorted_df.head(10)
-    top_products = [
-        {
-            "name": r["product_name"][:60],
-            "brand": r["brand_name"],
-            "category": r["category_name"],
-            "revenue": int(r["sale_amount"]),
-            "revenue_pct": round(float(r["sale_amount"]) / total_revenue * 100, 3),
-            "sold": int(r["sale_qty"]),
-            "price": int(r["sale_price"]),
-        }
-        for _, r in top10.iterrows()
-    ]
+    top10 = df.iloc[pareto.order[:10]]
+    top10 = top10.assign(revenue_pct=top10["sale_amount"] / total_revenue * 100)
+    top_products = serialize.records(top10, {
+        "name": ("product_name", truncated(60)),
+        "brand": ("brand_name", as_is),
+        "category": ("category_name", as_is),
+        "revenue": ("sale_amount", as_int),
+        "revenue_pct": ("revenue_pct", np_rounded(3)),
+        "sold": ("sale_qty", as_int),
+        "price": ("sale_price", as_int),
+    })
 
     return {
         "pareto_points": pareto_points,
@@ -1009,22 +1217,38 @@ def abc_pareto():
     }
 
 
+PARETO_GROUP_ROW = {
+    "name": ("name", as_is),
+    "products": ("products", as_int),
+    "revenue": ("revenue", as_int),
+    "pct_80": ("pct_80", as_float),
+    "pct_95": ("pct_95", as_float),
+    "top_product_pct": ("top_product_pct", as_float),
+}
+
+
+@app.get("/api/abc-pareto/groups")
+@serialize.json_endpoint
+def abc_pareto_groups(
+    by: str = Query("category", pattern="^(category|brand)$"),
+    limit: int = Query(50, ge=1, le=5000),
+):
+    """Pareto thresholds of every category or brand: the share of its products making 80% / 95% of its revenue"""
+    ds = catalog
+    table = ds.pareto.groups[f"{by}_name"]
+    top = table.sort_values("revenue", ascending=False, kind="stable").head(limit)
+    return {"by": by, "total": len(table), "groups": serialize.records(top, PARETO_GROUP_ROW)}
+
+
 # --- RECOMMENDER ---
 @app.get("/api/recommender")
+@cached
+@serialize.json_endpoint
 def recommender():
     # Analyze each category for entry potential
-    cat_stats = df.groupby("category_name").agg(
-        revenue=("sale_amount", "sum"),
-        products=("product_code", "count"),
-        sold=("sale_qty", "sum"),
-        avg_price=("sale_price", "mean"),
-        avg_merchants=("merchant_count", "mean"),
-        avg_rating=("product_rate", "mean"),
-        total_reviews=("review_qty", "sum"),
-    ).reset_index()
-
     # Filter out tiny categories
-    cat_stats = cat_stats[cat_stats["products"] >= 5].copy()
+    ds = catalog
+    cat_stats = ds.aggs.category[ds.aggs.category["products"] >= 5].copy()
     
     if len(cat_stats) == 0:
         return {"recommendations": [], "total_categories": 0}
@@ -1064,33 +1288,29 @@ def recommender():
     # Sort by entry score
     cat_stats = cat_stats.sort_values("entry_score", ascending=False)
 
-    recommendations = []
-    for _, r in cat_stats.head(15).iterrows():
-        recommendations.append({
-            "category": r["category_name"],
-            "entry_score": round(float(r["entry_score"]), 1),
-            "demand_score": round(float(r["demand_score"]), 1),
-            "competition_score": round(float(r["competition_score"]), 1),
-            "margin_score": round(float(r["margin_score"]), 1),
-            "efficiency_score": round(float(r["efficiency_score"]), 1),
-            "revenue": int(r["revenue"]),
-            "products": int(r["products"]),
-            "avg_price": int(r["avg_price"]),
-            "avg_merchants": round(float(r["avg_merchants"]), 1),
-            "avg_rating": round(float(r["avg_rating"]), 2),
-            "sold": int(r["sold"]),
-        })
+    recommendations = serialize.records(cat_stats.head(15), {
+        "category": ("category_name", as_is),
+        "entry_score": ("entry_score", rounded(1)),
+        "demand_score": ("demand_score", rounded(1)),
+        "competition_score": ("competition_score", rounded(1)),
+        "margin_score": ("margin_score", rounded(1)),
+        "efficiency_score": ("efficiency_score", rounded(1)),
+        "revenue": ("revenue", as_int),
+        "products": ("products", as_int),
+        "avg_price": ("avg_price", as_int),
+        "avg_merchants": ("avg_merchants", rounded(1)),
+        "avg_rating": ("avg_rating", rounded(2)),
+        "sold": ("sold", as_int),
+    })
 
     # Category scatter data for chart
-    scatter = []
-    for _, r in cat_stats.head(100).iterrows():
-        scatter.append({
-            "name": r["category_name"],
-            "demand": round(float(r["demand_score"]), 1),
-            "competition": round(float(r["competition_score"]), 1),
-            "entry_score": round(float(r["entry_score"]), 1),
-            "revenue": int(r["revenue"]),
-        })
+    scatter = serialize.records(cat_stats.head(100), {
+        "name": ("category_name", as_is),
+        "demand": ("demand_score", rounded(1)),
+        "competition": ("competition_score", rounded(1)),
+        "entry_score": ("entry_score", rounded(1)),
+        "revenue": ("revenue", as_int),
+    })
 
     # Score distribution
     bins = [0, 20, 40, 60, 80, 100]
@@ -1106,6 +1326,54 @@ def recommender():
     }
 
 
+# --- ADMIN ---
+@app.post("/api/admin/reload")
+@serialize.json_endpoint
+def reload_data():
+    if reload_stats["running"]:
+        return {"status": "already running", "version": catalog.version}
+    threading.Thread(target=_reload, daemon=True).start()
+    return {"status": "started", "version": catalog.version}
+
+
+@app.post("/api/admin/reload-model")
+@serialize.json_endpoint
+def reload_model():
+    if SHARED:
+        # The model is part of the shared file: republish it, the other workers follow
+        if not _reload():
+            return {"status": "already running", "version": catalog.version}
+        return {"status": "reloaded", "version": catalog.version, **models.stats()}
+    sales_model = models.reload(force=True)
+    if sales_model is None:
+        return {"error": "Model not trained yet"}
+    catalog.predictions(sales_model)
+    return {"status": "reloaded", **models.stats()}
+
+
+# --- METRICS ---
+@app.get("/api/metrics")
+@serialize.json_endpoint
+def get_metrics():
+    return {
+        "data_version": catalog.version,
+        "shared": SHARED,
+        "pid": os.getpid(),
+        "reload": dict(reload_stats),
+        "model": models.stats(),
+        "response_cache": response_cache.stats(),
+        # "coalesced": requests that waited for an identical in-flight computation instead of running their own
+        "single_flight": response_cache.flights.stats(),
+    }
+
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    workers = int(os.environ.get("KASPI_WORKERS", "1"))
+    if workers > 1:
+        # Publish once here; every worker then only attaches to the file
+        os.environ["KASPI_SHARED"] = "1"
+        _attach_shared()
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
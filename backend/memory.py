@@ -0,0 +1,39 @@
+"""Resident memory of this process, for the reload and training reports"""
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _status_mb(field):
+    # Linux only: VmRSS (now) and VmHWM (peak) in /proc/self/status, in kB
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Restart the peak RSS from the current RSS (Linux only: "5" resets VmHWM)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def rss_mb():
+    """Current RSS in MB, None where /proc is missing"""
+    return _status_mb("VmRSS")
+
+
+def peak_rss_mb():
+    """Peak RSS in MB since start or the last reset_peak_rss; getrusage's peak elsewhere, else None"""
+    peak = _status_mb("VmHWM")
+    if peak is not None or resource is None:
+        return peak
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # kB on Linux
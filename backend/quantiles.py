@@ -0,0 +1,98 @@
+"""Exact quantiles of catalog columns per category, brand and (category, brand).
+
+For every column and grouping the values are sorted once per data version:
+each group's values are one contiguous run of a single array, located by an
+offsets array. A quantile is then an index computation and at most two
+lookups, interpolated like numpy's default "linear" method (and so like
+``Series.quantile`` and ``Series.median``).
+"""
+import numpy as np
+
+COLUMNS = ("sale_price", "sale_qty", "sale_amount", "merchant_count")
+
+
+class SortedGroups:
+    """Values sorted within groups; ``group`` -1 rows are left out"""
+
+    def __init__(self, values, group, n_groups):
+        order = np.lexsort((values, group))
+        sorted_group = group[order]
+        self.values = values[order]
+        self.offsets = np.searchsorted(sorted_group, np.arange(n_groups + 1))
+
+    def run(self, g):
+        return self.values[self.offsets[g]:self.offsets[g + 1]]
+
+
+def quantile_of_sorted(values, q):
+    """``np.quantile(values, q)`` of an already sorted array, or None if it is empty"""
+    n = len(values)
+    if n == 0:
+        return None
+    position = (n - 1) * q
+    below = int(np.floor(position))
+    gamma = position - below
+    a = values[below].item()
+    b = values[min(below + 1, n - 1)].item()
+    # The same lerp as numpy: from the nearer end, so q=1 gives exactly the max
+    if gamma >= 0.5:
+        return b - (b - a) * (1 - gamma)
+    return a + (b - a) * gamma
+
+
+class QuantileTables:
+    def __init__(self, df, columns=COLUMNS):
+        categories = df["category_name"]
+        brands = df["brand_name"]
+        self.category_codes = {name: i for i, name in enumerate(categories.cat.categories.tolist())}
+        self.brand_codes = {name: i for i, name in enumerate(brands.cat.categories.tolist())}
+
+        cat = categories.cat.codes.to_numpy().astype(np.int64)
+        brand = brands.cat.codes.to_numpy().astype(np.int64)
+        # Observed (category, brand) pairs, numbered in (category, brand) order
+        both = (cat >= 0) & (brand >= 0)
+        pair_keys, pair = np.unique(cat[both] * len(self.brand_codes) + brand[both], return_inverse=True)
+        self.pair_codes = {(int(k) // len(self.brand_codes), int(k) % len(self.brand_codes)): i for i, k in enumerate(pair_keys)}
+        pair_group = np.full(len(df), -1, dtype=np.int64)
+        pair_group[both] = pair
+
+        groupings = {
+            "all": (np.zeros(len(df), dtype=np.int64), 1),
+            "category": (cat, len(self.category_codes)),
+            "brand": (brand, len(self.brand_codes)),
+            "category_brand": (pair_group, len(pair_keys)),
+        }
+        self.tables = {}
+        for column in columns:
+            values = df[column].to_numpy()
+            missing = np.isnan(values) if values.dtype.kind == "f" else None
+            for name, (group, n_groups) in groupings.items():
+                if missing is not None and missing.any():
+                    group = np.where(missing, -1, group)
+                self.tables[column, name] = SortedGroups(values, group, n_groups)
+
+    @property
+    def nbytes(self):
+        return sum(t.values.nbytes + t.offsets.nbytes for t in self.tables.values())
+
+    def values(self, column, category=None, brand=None):
+        """Sorted values of ``column`` in the category/brand/pair (everything when both are None).
+
+        Unknown names give an empty array; a column that is not tabulated raises KeyError.
+        """
+        if category is not None and brand is not None:
+            key = (self.category_codes.get(category), self.brand_codes.get(brand))
+            table, g = self.tables[column, "category_brand"], self.pair_codes.get(key)
+        elif category is not None:
+            table, g = self.tables[column, "category"], self.category_codes.get(category)
+        elif brand is not None:
+            table, g = self.tables[column, "brand"], self.brand_codes.get(brand)
+        else:
+            table, g = self.tables[column, "all"], 0
+        if g is None:
+            return table.values[:0]
+        return table.run(g)
+
+    def quantile(self, column, q, category=None, brand=None):
+        """Quantile ``q`` (0..1) of ``column`` for the group, None if the group has no rows"""
+        return quantile_of_sorted(self.values(column, category, brand), q)
@@ -0,0 +1,111 @@
+"""In-memory search structures: substring search and typeahead suggestions"""
+import re
+from bisect import bisect_left
+
+import numpy as np
+
+_SEP = "\x00"
+_WORD = re.compile(r"\w+")
+
+
+def _trigram_keys(codes):
+    # Code points fit in 21 bits, so three of them pack into one int64
+    return (codes[:-2] << 42) | (codes[1:-1] << 21) | codes[2:]
+
+
+def _code_points(text):
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+
+class TrigramIndex:
+    """Maps every trigram of the lowercased texts to the sorted rows containing it.
+
+    Postings are stored CSR-style: ``keys`` (sorted trigram keys), ``offsets``
+    into ``rows``. A trigram may end with the end-of-text marker, so two-letter
+    queries are answered exactly from the postings of ``q + any character``.
+    Missing texts (None/NaN) never match.
+    """
+
+    def __init__(self, texts):
+        self.texts = [t.lower().replace(_SEP, "") if isinstance(t, str) else None for t in texts]
+        lens = np.fromiter((len(t) if t is not None else 0 for t in self.texts), dtype=np.int64, count=len(self.texts))
+        codes = _code_points(_SEP.join(t or "" for t in self.texts) + _SEP)
+        row_of = np.repeat(np.arange(len(self.texts), dtype=np.int32), lens + 1)
+
+        keys = _trigram_keys(codes)
+        valid = (codes[:-2] != 0) & (codes[1:-1] != 0)
+        keys, rows = keys[valid], row_of[:-2][valid]
+
+        # Rows are already ascending, so a stable sort by key keeps each posting list sorted
+        order = np.argsort(keys, kind="stable")
+        keys, rows = keys[order], rows[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (rows[1:] != rows[:-1])
+        keys, rows = keys[keep], rows[keep]
+
+        self.keys, starts = np.unique(keys, return_index=True)
+        self.offsets = np.append(starts, len(rows)).astype(np.int64)
+        self.rows = rows
+
+    @property
+    def nbytes(self):
+        return self.keys.nbytes + self.offsets.nbytes + self.rows.nbytes
+
+    def _postings(self, key):
+        i = np.searchsorted(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return self.rows[:0]
+        return self.rows[self.offsets[i]:self.offsets[i + 1]]
+
+    def search(self, query):
+        """Sorted row positions whose text contains ``query`` (case-insensitive)"""
+        q = query.lower()
+        if len(q) < 2:
+            return np.array([i for i, t in enumerate(self.texts) if t is not None and q in t], dtype=np.int64)
+
+        if len(q) == 2:
+            lo = (ord(q[0]) << 42) | (ord(q[1]) << 21)
+            start, end = np.searchsorted(self.keys, [lo, lo + (1 << 21)])
+            return np.unique(self.rows[self.offsets[start]:self.offsets[end]]).astype(np.int64)
+
+        postings = sorted((self._postings(k) for k in np.unique(_trigram_keys(_code_points(q)))), key=len)
+        candidates = postings[0]
+        for other in postings[1:]:
+            # Once few candidates are left, checking them directly beats another intersection
+            if len(candidates) <= 64:
+                break
+            candidates = np.intersect1d(candidates, other, assume_unique=True)
+        if len(q) > 3:
+            texts = self.texts
+            candidates = [r for r in candidates.tolist() if q in texts[r]]
+        return np.asarray(candidates, dtype=np.int64)
+
+
+class PrefixSuggester:
+    """Typeahead over a fixed list of names, ranked by precomputed weights.
+
+    Every name is stored once per word start (and at position 0) as a
+    lowercased suffix in one sorted list, so both "prefix of the name" and
+    "prefix of any word" are a single bisect range.
+    """
+
+    def __init__(self, names, **weights):
+        self.names = list(names)
+        self.weights = {key: np.asarray(values) for key, values in weights.items()}
+        entries = []
+        for i, name in enumerate(self.names):
+            low = name.lower()
+            for start in {0, *(m.start() for m in _WORD.finditer(low))}:
+                entries.append((low[start:], i))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = np.array([i for _, i in entries], dtype=np.int64)
+
+    def suggest(self, prefix, k=8, rank_by="revenue"):
+        """Indices into ``names`` of the top ``k`` matches by ``weights[rank_by]``"""
+        p = prefix.lower()
+        lo = bisect_left(self.keys, p)
+        hi = bisect_left(self.keys, p + "\U0010ffff", lo)
+        ids = np.unique(self.ids[lo:hi])
+        order = np.argsort(-self.weights[rank_by][ids], kind="stable")[:k]
+        return ids[order].tolist()
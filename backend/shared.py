@@ -0,0 +1,130 @@
+"""One built dataset shared by several worker processes through a memory-mapped file.
+
+The file holds a pickle (protocol 5) of the objects followed by their NumPy
+buffers, written out of band and 64-byte aligned. Attaching maps the file
+read-only and unpickles with every buffer pointing into the mapping, so the
+numeric columns, categorical codes and index arrays are the same page-cache
+pages in every process; only Python objects (strings, dicts) are rebuilt per
+process.
+
+The first process to find the file missing or stale builds and publishes it
+under an exclusive lock while the others wait, then everyone attaches. The
+file is replaced atomically, so processes still mapping an older version keep
+reading it until they switch.
+"""
+import io
+import json
+import mmap
+import os
+import pickle
+import struct
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process publishes, no lock needed
+    fcntl = None
+
+MAGIC = b"KASPISH1"
+ALIGN = 64
+_U64 = struct.Struct("<Q")
+
+
+def _aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+class _Pickler(pickle.Pickler):
+    def reducer_override(self, obj):
+        # np.memmap (snapshot columns) would be pickled in band; send its data like a plain array
+        if isinstance(obj, np.memmap):
+            return obj.view(np.ndarray).__reduce_ex__(5)
+        return NotImplemented
+
+
+def write(path, obj, meta):
+    """Publish ``obj`` with JSON ``meta`` at ``path``, replacing any previous file"""
+    buffers = []
+    out = io.BytesIO()
+    _Pickler(out, protocol=5, buffer_callback=buffers.append).dump(obj)
+    payload = out.getvalue()
+    raw = [b.raw() for b in buffers]
+    layout, offset = [], 0  # relative to the first aligned byte after the payload
+    for r in raw:
+        layout.append([offset, r.nbytes])
+        offset = _aligned(offset + r.nbytes)
+    header = json.dumps({**meta, "buffers": layout}).encode("utf-8")
+    head = MAGIC + _U64.pack(len(header)) + header + _U64.pack(len(payload))
+    base = _aligned(len(head) + len(payload))
+
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(head)
+        f.write(payload)
+        for (off, _), r in zip(layout, raw):
+            f.seek(base + off)
+            f.write(r)
+    os.replace(tmp, path)
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        return None, None
+    header = json.loads(f.read(_U64.unpack(f.read(_U64.size))[0]))
+    payload_len = _U64.unpack(f.read(_U64.size))[0]
+    return header, (f.tell(), payload_len)
+
+
+def read_meta(path):
+    """The metadata of the file at ``path``, or None if there is none"""
+    try:
+        with open(path, "rb") as f:
+            return _read_header(f)[0]
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def attach(path):
+    """(objects, meta) of the file at ``path``, NumPy arrays mapped read-only"""
+    with open(path, "rb") as f:
+        meta, (payload_at, payload_len) = _read_header(f)
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    base = _aligned(payload_at + payload_len)
+    # The arrays keep slices of the view, and so the mapping, alive
+    buffers = [view[base + off:base + off + n] for off, n in meta["buffers"]]
+    return pickle.loads(view[payload_at:payload_at + payload_len], buffers=buffers), meta
+
+
+@contextmanager
+def _locked(path):
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def open_shared(path, key, build):
+    """(objects, version) published at ``path`` for ``key``, publishing them first if needed.
+
+    ``key`` is a JSON-able description of the sources; a file with another
+    key is rebuilt with ``build(version)``, the version one above the file's.
+    """
+    with _locked(path + ".lock"):
+        meta = read_meta(path)
+        if meta is None or meta.get("key") != key:
+            version = meta["version"] + 1 if meta else 1
+            start = time.perf_counter()
+            write(path, build(version), {"key": key, "version": version})
+            print(f"Published shared dataset v{version} in {time.perf_counter() - start:.2f}s")
+        start = time.perf_counter()
+        obj, meta = attach(path)
+    print(f"Attached shared dataset v{meta['version']} in {time.perf_counter() - start:.2f}s")
+    return obj, meta["version"]
@@ -0,0 +1,173 @@
+"""Binary columnar snapshot of the cleaned catalog.
+
+The snapshot is a directory with one file per column plus ``meta.json``:
+numeric, bool and datetime columns are plain ``.npy`` files that are
+memory-mapped on load, string columns are a single UTF-8 blob joined by NUL
+with a ``.npy`` null mask, categorical columns are memory-mapped codes plus a
+blob of their categories, and ``df.attrs`` (load statistics) go into the
+metadata. The snapshot is keyed by a fingerprint of the source CSV (size,
+mtime and SHA-1) and is rebuilt only when the CSV changes.
+"""
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Bump whenever ingest.read_catalog changes the resulting frame
+SNAPSHOT_VERSION = 6
+
+_SEP = "\x00"
+
+
+def fingerprint(path, with_hash=True):
+    st = os.stat(path)
+    fp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    if with_hash:
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        fp["sha1"] = h.hexdigest()
+    return fp
+
+
+def _read_meta(snapshot_dir):
+    try:
+        with open(os.path.join(snapshot_dir, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_meta(snapshot_dir, meta):
+    path = os.path.join(snapshot_dir, "meta.json")
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def is_fresh(csv_path, snapshot_dir, meta=None):
+    """Return True if the snapshot in ``snapshot_dir`` (or with ``meta``) matches ``csv_path``."""
+    if meta is None:
+        meta = _read_meta(snapshot_dir)
+    if meta is None or meta.get("version") != SNAPSHOT_VERSION:
+        return False
+    saved = meta["fingerprint"]
+    current = fingerprint(csv_path, with_hash=False)
+    if current["size"] != saved["size"]:
+        return False
+    if current["mtime_ns"] == saved["mtime_ns"]:
+        return True
+    # Same size, touched file: fall back to the content hash
+    current = fingerprint(csv_path)
+    if current["sha1"] != saved["sha1"]:
+        return False
+    # Remember the new mtime, or every later start would hash the CSV again
+    try:
+        _write_meta(snapshot_dir, {**meta, "fingerprint": current})
+    except OSError:
+        pass
+    return True
+
+
+def load(csv_path, snapshot_dir):
+    """Map a fresh snapshot into a DataFrame, or return None if it is missing, stale or unreadable."""
+    if not os.path.exists(csv_path):
+        return None
+    meta = _read_meta(snapshot_dir)
+    if not is_fresh(csv_path, snapshot_dir, meta):
+        return None
+    try:
+        columns = _read_columns(snapshot_dir, meta)
+    except (OSError, ValueError) as e:
+        # Another process replaced the snapshot while it was read: parse the CSV instead
+        print(f"Could not read snapshot: {e}")
+        return None
+    # copy=False keeps the memory-mapped columns as separate, un-consolidated blocks
+    df = pd.DataFrame(columns, copy=False)
+    df.attrs.update(meta.get("attrs", {}))
+    return df
+
+
+def _read_columns(snapshot_dir, meta):
+    columns = {}
+    for i, col in enumerate(meta["columns"]):
+        base = os.path.join(snapshot_dir, str(i))
+        if col["kind"] == "array":
+            columns[col["name"]] = np.load(base + ".npy", mmap_mode="r")
+        elif col["kind"] == "str":
+            values = _read_strings(base + ".str", meta["n_rows"])
+            nulls = np.load(base + ".null.npy")
+            values[nulls] = np.nan
+            columns[col["name"]] = values
+        elif col["kind"] == "category":
+            categories = _read_strings(base + ".str", col["n_categories"])
+            codes = np.load(base + ".npy", mmap_mode="r")
+            columns[col["name"]] = pd.Categorical.from_codes(codes, categories=pd.Index(categories))
+        else:
+            columns[col["name"]] = np.load(base + ".npy", allow_pickle=True)
+    return columns
+
+
+def _read_strings(path, n):
+    with open(path, "rb") as f:
+        values = np.array(f.read().decode("utf-8").split(_SEP), dtype=object)
+    return values[:n]
+
+
+def _write_strings(path, values):
+    with open(path, "wb") as f:
+        f.write(_SEP.join(values).encode("utf-8"))
+
+
+def _is_plain_str(series):
+    if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        return False
+    return not series.dropna().str.contains(_SEP, regex=False).any()
+
+
+def save(df, csv_path, snapshot_dir, fp=None):
+    """Write ``df`` as the snapshot of ``csv_path``, replacing any previous one."""
+    if fp is None:
+        fp = fingerprint(csv_path)
+    tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    columns = []
+    for i, name in enumerate(df.columns):
+        series = df[name]
+        base = os.path.join(tmp_dir, str(i))
+        col = {"name": name}
+        if series.dtype != object and isinstance(series.dtype, np.dtype):
+            np.save(base + ".npy", series.to_numpy())
+            col["kind"] = "array"
+        elif isinstance(series.dtype, pd.CategoricalDtype) and _is_plain_str(series.cat.categories.to_series()):
+            np.save(base + ".npy", series.cat.codes.to_numpy())
+            _write_strings(base + ".str", series.cat.categories.astype(str))
+            col["kind"] = "category"
+            col["n_categories"] = len(series.cat.categories)
+        elif _is_plain_str(series):
+            np.save(base + ".null.npy", series.isna().to_numpy())
+            _write_strings(base + ".str", series.fillna("").astype(str))
+            col["kind"] = "str"
+        else:
+            np.save(base + ".npy", series.to_numpy(dtype=object), allow_pickle=True)
+            col["kind"] = "object"
+        columns.append(col)
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": fp,
+        "n_rows": len(df),
+        "columns": columns,
+        "attrs": df.attrs,
+    }
+    _write_meta(tmp_dir, meta)
+
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    os.replace(tmp_dir, snapshot_dir)
@@ -0,0 +1,79 @@
+import pandas as pd
+import pytest
+
+import ingest
+
+HEADER = ("product_code,product_name,brand_name,category_name,_category_name,sale_price,sale_qty,sale_amount,"
+          "product_rate,review_qty,merchant_count,amount_abc,show_order_num,created_dt,last_sale_date,preview_image_list")
+
+
+def write_csv(tmp_path, rows):
+    path = tmp_path / "catalog.csv"
+    path.write_text("\n".join([HEADER, *rows]) + "\n", encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def mixed_csv(tmp_path):
+    # Codes that look numeric, blank text and number cells
+    return write_csv(tmp_path, [
+        "001,Товар 1,Apple,Смартфоны,Электроника,1000,5,5000,4.5,10,3,1,1,2022-03-26 13:22:44,2020-10-23,[]",
+        ",Товар 2,,Смартфоны,Электроника,,2,,4.0,1,1,2,2,2022-03-26,,[]",
+        "42,,Samsung,,Электроника,300,1,300,,0,1,,3,,2021-01-01,",
+        "1e3,Товар 4,Samsung,Чехлы,,250,,0,3.5,2,,3,4,2022-01-01,2021-02-02,[]",
+    ])
+
+
+def read_with(engine, path, consumer="api"):
+    before = ingest.CSV_ENGINE
+    ingest.CSV_ENGINE = engine
+    try:
+        return ingest.read_catalog(path, consumer)
+    finally:
+        ingest.CSV_ENGINE = before
+
+
+@pytest.mark.parametrize("consumer", ["api", "train"])
+def test_engines_read_the_same_frame(mixed_csv, consumer):
+    pytest.importorskip("pyarrow")
+    c = read_with("c", mixed_csv, consumer)
+    arrow = read_with("pyarrow", mixed_csv, consumer)
+    pd.testing.assert_frame_equal(arrow, c)
+    assert arrow.attrs == c.attrs
+
+
+def test_codes_stay_text(mixed_csv):
+    df = read_with("c", mixed_csv)
+    assert df["product_code"].tolist()[::2] == ["001", "42"]
+    assert df["product_code"].tolist()[3] == "1e3"
+    assert df["product_code"].isna().tolist() == [False, True, False, False]
+    assert df["product_name"].isna().sum() == 1
+
+
+def test_image_urls_count_malformed_cells():
+    images = pd.Series([
+        "[{'small': 'https://img/s/1.jpg', 'medium': 'https://img/m/1.jpg'}]",
+        "[{'small': 'https://img/s/2.jpg'}, {'small': 'https://img/s/x.jpg'}]",
+        "[]",
+        None,
+        "",
+        "garbage{",                               # does not parse
+        "[{'small': 'https://img/s/3.jpg'",       # cut short
+        "{'small': 'https://img/s/4.jpg'}",       # not a list
+        "[1, 2]",                                 # not a list of dicts
+        "[{'small': 'a'}], [{'small': 'b'}]",     # two lists in one cell
+    ])
+    for batch_size in (1, 3, 256):
+        urls, failed = ingest.extract_image_urls(images, batch_size=batch_size)
+        assert urls.tolist() == ["https://img/m/1.jpg", "https://img/s/2.jpg"] + [""] * 8
+        assert failed == 5
+
+
+def test_read_catalog_reports_image_failures(tmp_path):
+    path = write_csv(tmp_path, [
+        "1,Товар 1,Apple,Смартфоны,Электроника,1000,5,5000,4.5,10,3,1,1,2022-03-26,2020-10-23,\"[{'small': 's.jpg'}]\"",
+        "2,Товар 2,Apple,Смартфоны,Электроника,1000,5,5000,4.5,10,3,1,1,2022-03-26,2020-10-23,garbage{",
+    ])
+    df = read_with("c", path)
+    assert df["image_url"].tolist() == ["s.jpg", ""]
+    assert df.attrs["image_parse_failures"] == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.preprocessing import LabelEncoder
+
+import main
+import model_registry
+
+
+class Registry:
+    def __init__(self, sales_model):
+        self.sales_model = sales_model
+
+    def get(self):
+        return self.sales_model
+
+
+@pytest.fixture
+def client(monkeypatch):
+    rng = np.random.default_rng(0)
+    encoders = {"category": LabelEncoder().fit(["Смартфоны", "Чехлы"]), "brand": LabelEncoder().fit(["Apple", "Samsung"])}
+    X = np.column_stack([rng.integers(0, 2, 200), rng.integers(0, 2, 200), rng.uniform(1e3, 1e6, 200), rng.integers(1, 50, 200)])
+    model = GradientBoostingRegressor(n_estimators=5, max_depth=2).fit(X, rng.uniform(0, 5, 200))
+    monkeypatch.setattr(main, "models", Registry(model_registry.SalesModel(model, encoders, "test")))
+    # No lifespan: the endpoint needs only the model, not the catalog
+    return TestClient(main.app)
+
+
+def post(client, body, content_type="application/json"):
+    return client.post("/api/predict/batch", content=body, headers={"content-type": content_type})
+
+
+def test_predicts_rows_and_counts_unknown_labels(client):
+    r = post(client, '[{"category": "Чехлы", "brand": "Apple", "price": 5000, "merchants": 3},'
+                     ' {"category": "Нет такой", "price": 7000}]')
+    assert r.status_code == 200
+    body = r.json()
+    assert body["count"] == 2 and len(body["predictions"]) == 2
+    assert body["unknown_categories"] == 1 and body["unknown_brands"] == 0
+
+
+@pytest.mark.parametrize("body", [
+    '[{"category": "Чехлы", "brand": ["x"], "price": 5000}]',
+    '[{"brand_name": "Apple", "price": 5000}]',
+    '[{"category": {"a": 1}, "price": 5000}]',
+    '[{"category": "Чехлы"}]',
+    '[5000]',
+    '{"rows": "x"}',
+])
+def test_rejects_rows_that_are_not_scalar_fields(client, body):
+    assert post(client, body).status_code == 422
+
+
+def test_empty_batches(client):
+    assert post(client, "[]").json()["count"] == 0
+    assert post(client, "category,brand,price,merchants\n", "text/csv").json()["count"] == 0
+
+
+def test_csv_needs_known_columns(client):
+    assert "Unknown fields" in post(client, "category_name,price\nЧехлы,5000\n", "text/csv").json()["error"]
+    assert post(client, "category,price\nЧехлы,5000\n", "text/csv").json()["count"] == 1
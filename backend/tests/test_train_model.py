@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+import train_model
+
+
+@pytest.fixture
+def saved(monkeypatch, tmp_path):
+    """Runs train_model.main on synthetic data without fitting; returns {file name: object dumped}"""
+    dumped = {}
+    X = np.column_stack([np.arange(100) % 5, np.arange(100) % 3, np.arange(100) * 10.0, np.arange(100) % 7])
+    monkeypatch.setattr(train_model, "DIR", str(tmp_path))
+    monkeypatch.setattr(train_model, "load_training_data", lambda: (X, np.arange(100.0), {"category": None}))
+    monkeypatch.setattr(train_model, "fit", lambda kind, *a: (f"{kind} model", {
+        "fit_seconds": 0.0, "peak_rss_mb": None, "fit_rss_mb": None, "test_r2": 0.0}))
+    monkeypatch.setattr(train_model.trees, "check", lambda model, X: {"supported": False})
+    monkeypatch.setattr(train_model.joblib, "dump", lambda obj, path: dumped.__setitem__(path.rsplit("/", 1)[-1], obj))
+
+    def run(*argv):
+        monkeypatch.setattr("sys.argv", ["train_model.py", *argv])
+        train_model.main()
+        return dumped
+    return run
+
+
+@pytest.mark.parametrize("argv, expected", [
+    ((), "gbr model"),
+    (("--model", "hist"), "hist model"),
+    (("--compare",), "gbr model"),
+    (("--compare", "--model", "gbr"), "gbr model"),
+    (("--compare", "--model", "hist"), "hist model"),
+])
+def test_saves_the_requested_model(saved, argv, expected):
+    assert saved(*argv)["model.joblib"] == expected
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.preprocessing import LabelEncoder
+
+import model_registry
+import trees
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(42)
+    X = np.column_stack([
+        rng.integers(0, 20, 600),
+        rng.integers(0, 50, 600),
+        rng.lognormal(10, 1.5, 600).round(),
+        rng.integers(1, 80, 600),
+    ]).astype(np.float64)
+    y = np.log1p(X[:, 2] / 1e4 + X[:, 3] + rng.normal(0, 1, 600) ** 2)
+    return X, y
+
+
+@pytest.fixture(scope="module")
+def gbr(data):
+    X, y = data
+    return GradientBoostingRegressor(n_estimators=30, max_depth=4, learning_rate=0.1, random_state=0).fit(X, y)
+
+
+@pytest.mark.parametrize("rows", [1, 7, model_registry.COMPILED_MAX_ROWS, 300])
+def test_compiled_matches_sklearn(data, gbr, rows):
+    X = data[0][:rows]
+    compiled = trees.compile_model(gbr)
+    assert np.allclose(compiled.predict(X), gbr.predict(X))
+    assert np.array_equal(compiled.predict(X), gbr.predict(X))  # the module promises bit-for-bit
+
+
+def test_compiled_matches_on_split_thresholds(data, gbr):
+    # x <= threshold is decided in float32 by the compiled trees; rows sitting exactly on a split
+    compiled = trees.compile_model(gbr)
+    split = compiled.children[0::2] != np.arange(len(compiled.threshold))
+    X = np.repeat(data[0][:1], split.sum(), axis=0)
+    X[np.arange(split.sum()), compiled.feature[split]] = compiled.threshold[split]
+    assert np.array_equal(compiled.predict(X), gbr.predict(X))
+
+
+def encoders():
+    return {"category": LabelEncoder().fit(np.arange(20)), "brand": LabelEncoder().fit(np.arange(50))}
+
+
+@pytest.mark.parametrize("rows", [1, model_registry.COMPILED_MAX_ROWS, model_registry.COMPILED_MAX_ROWS + 1, 300])
+def test_sales_model_paths_agree(data, gbr, rows):
+    # Up to COMPILED_MAX_ROWS rows go through the compiled trees, more through sklearn
+    sales_model = model_registry.SalesModel(gbr, encoders(), "test")
+    assert sales_model.compiled is not None
+    X = data[0][:rows]
+    assert np.array_equal(sales_model._predict(X), gbr.predict(X))
+
+
+def test_unsupported_models_fall_back_to_sklearn(data):
+    X, y = data
+    hist = HistGradientBoostingRegressor(max_iter=20, random_state=0).fit(X, y)
+    assert trees.compile_model(hist) is None
+    sales_model = model_registry.SalesModel(hist, encoders(), "test")
+    assert np.array_equal(sales_model._predict(X[:1]), hist.predict(X[:1]))
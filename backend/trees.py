@@ -0,0 +1,161 @@
+"""Array-based evaluator for a fitted GradientBoostingRegressor.
+
+All trees are flattened into one set of node arrays (feature, threshold,
+left, right, scaled leaf value), leaves pointing at themselves, so every tree
+is walked for every row at once in ``depth`` vectorized steps. Rows are
+compared as float32 and tree outputs are added to the init value one tree at
+a time, in sklearn's order, so the predictions are bit-for-bit the same as
+``model.predict``.
+
+Run ``python trees.py`` to check that against model.joblib; tests/test_trees.py
+checks it on synthetic models without the catalog.
+"""
+import numpy as np
+
+
+class CompiledEnsemble:
+    def __init__(self, feature, threshold, left, right, value, roots, depth, init, n_features):
+        self.feature = feature.astype(np.int32)
+        self.threshold = threshold
+        # x <= t for a float32 x is x <= (the largest float32 not above t)
+        self.threshold32 = threshold.astype(np.float32)
+        above = self.threshold32.astype(np.float64) > threshold
+        self.threshold32[above] = np.nextafter(self.threshold32[above], np.float32(-np.inf))
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.empty(2 * len(left), dtype=np.int32)
+        self.children[0::2], self.children[1::2] = left, right
+        self.value = value  # leaf value * learning_rate, as sklearn adds it
+        self.roots = roots.astype(np.int32)
+        self.depth = depth
+        self.init = init
+        self.n_features = n_features
+
+    @property
+    def nbytes(self):
+        arrays = (self.feature, self.threshold, self.threshold32, self.children, self.value, self.roots)
+        return sum(a.nbytes for a in arrays)
+
+    def predict(self, X, chunk=256):
+        """Same as ``model.predict(X)``; rows are scored ``chunk`` at a time"""
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features)
+        out = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk):
+            out[start:start + chunk] = self._predict(X[start:start + chunk])
+        return out
+
+    def _predict(self, X):
+        n = len(X)
+        columns = np.ascontiguousarray(X.T).ravel()  # feature f of row r at f * n + r
+        rows = np.arange(n, dtype=np.int32)
+        node = np.repeat(self.roots[:, None], n, axis=1)  # (trees, rows)
+        for _ in range(self.depth):
+            x = columns.take(self.feature.take(node) * n + rows)
+            # not (x <= t) rather than x > t, so NaN goes right like in sklearn
+            go_right = ~(x <= self.threshold32.take(node))
+            node = self.children.take(2 * node + go_right)
+        # cumsum adds strictly in order: ((init + tree 1) + tree 2) + ...
+        terms = np.vstack([np.full((1, n), self.init), self.value.take(node)])
+        return np.cumsum(terms, axis=0)[-1]
+
+
+def compile_model(model):
+    """CompiledEnsemble of a fitted GradientBoostingRegressor, or None for other models"""
+    from sklearn.dummy import DummyRegressor
+    from sklearn.ensemble import GradientBoostingRegressor
+
+    if not isinstance(model, GradientBoostingRegressor):
+        return None
+    n_features = model.n_features_in_
+    if isinstance(model.init_, DummyRegressor):
+        init = float(model.init_.predict(np.zeros((1, n_features)))[0])
+    elif model.init_ == "zero":
+        init = 0.0
+    else:
+        # A custom init estimator is not a constant
+        return None
+
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset, depth = 0, 0
+    for estimator in model.estimators_[:, 0]:
+        tree = estimator.tree_
+        own = np.arange(tree.node_count) + offset
+        leaf = tree.children_left < 0
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(leaf, own, tree.children_left + offset))
+        rights.append(np.where(leaf, own, tree.children_right + offset))
+        values.append(model.learning_rate * tree.value[:, 0, 0])
+        roots.append(offset)
+        offset += tree.node_count
+        depth = max(depth, tree.max_depth)
+
+    return CompiledEnsemble(
+        np.concatenate(features),
+        np.concatenate(thresholds),
+        np.concatenate(lefts),
+        np.concatenate(rights),
+        np.concatenate(values),
+        np.array(roots),
+        depth,
+        init,
+        n_features,
+    )
+
+
+def check(model, X):
+    """Compare the compiled evaluator with ``model.predict`` on ``X``; returns a report dict"""
+    import time
+
+    compiled = compile_model(model)
+    if compiled is None:
+        return {"supported": False}
+    start = time.perf_counter()
+    expected = model.predict(X)
+    sklearn_s = time.perf_counter() - start
+    start = time.perf_counter()
+    got = compiled.predict(X)
+    compiled_s = time.perf_counter() - start
+
+    one = X[:1]
+    start = time.perf_counter()
+    for _ in range(100):
+        model.predict(one)
+    sklearn_one = (time.perf_counter() - start) / 100
+    start = time.perf_counter()
+    for _ in range(100):
+        compiled.predict(one)
+    compiled_one = (time.perf_counter() - start) / 100
+
+    return {
+        "supported": True,
+        "rows": len(X),
+        "identical": bool(np.array_equal(expected, got)),
+        "max_abs_diff": float(np.max(np.abs(expected - got))) if len(X) else 0.0,
+        "batch_seconds": {"sklearn": round(sklearn_s, 4), "compiled": round(compiled_s, 4)},
+        "single_row_us": {"sklearn": round(sklearn_one * 1e6, 1), "compiled": round(compiled_one * 1e6, 1)},
+    }
+
+
+if __name__ == "__main__":
+    import os
+    import sys
+
+    import joblib
+
+    import ingest
+
+    DIR = os.path.dirname(os.path.abspath(__file__))
+    model = joblib.load(os.path.join(DIR, "model.joblib"))
+    encoders = joblib.load(os.path.join(DIR, "encoders.joblib"))
+    df = ingest.read_catalog(os.path.join(DIR, "kaspi.csv"), "train")
+    codes = {name: {label: i for i, label in enumerate(enc.classes_.tolist())} for name, enc in encoders.items()}
+    X = np.column_stack([
+        df["category_name"].map(codes["category"]).fillna(0).to_numpy(dtype=np.float64),
+        df["brand_name"].map(codes["brand"]).fillna(0).to_numpy(dtype=np.float64),
+        df["sale_price"].to_numpy(),
+        df["merchant_count"].to_numpy(),
+    ])
+    report = check(model, X)
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    sys.exit(0 if report.get("identical") else 1)
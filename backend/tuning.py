@@ -0,0 +1,198 @@
+"""Hyperparameter search for the sales model: k-fold CV over a process pool.
+
+The encoded training matrix is written once as ``.npy`` files, keyed by the
+CSV fingerprint like the API snapshot, and every worker memory-maps those
+files read-only instead of re-reading the CSV or receiving a pickled copy.
+Every finished configuration is appended to a JSON-lines results file, and a
+rerun skips the configurations already in it, so an interrupted search
+resumes where it stopped. Run through ``python train_model.py search``.
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold
+
+import snapshot
+
+SEARCH_SPACES = {
+    "gbr": {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [4, 6, 8],
+        "learning_rate": [0.05, 0.1],
+        "subsample": [1.0, 0.8],
+    },
+    "hist": {
+        "learning_rate": [0.05, 0.1, 0.2],
+        "max_leaf_nodes": [15, 31, 63, 127],
+        "min_samples_leaf": [20, 50, 100],
+        "l2_regularization": [0.0, 1.0],
+    },
+}
+
+
+def configurations(kind, n_random=None, seed=42):
+    """Every parameter combination of ``kind``'s space, or ``n_random`` distinct ones of them"""
+    space = SEARCH_SPACES[kind]
+    names = sorted(space)
+    grid = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    if n_random is not None and n_random < len(grid):
+        grid = random.Random(seed).sample(grid, n_random)
+    return grid
+
+
+# --- Encoded matrix cache ---
+def encoded_matrix(csv_path, cache_dir, load_training_data):
+    """Paths of the cached X.npy / y.npy of ``csv_path``, the encoders and the CSV fingerprint.
+
+    ``load_training_data(csv_path)`` -> (X, y, encoders) is called only when
+    the cache is missing or the CSV changed.
+    """
+    meta_path = os.path.join(cache_dir, "meta.json")
+    x_path, y_path = os.path.join(cache_dir, "X.npy"), os.path.join(cache_dir, "y.npy")
+    enc_path = os.path.join(cache_dir, "encoders.joblib")
+    # Same meta.json layout and freshness rules as the API snapshot
+    if snapshot.is_fresh(csv_path, cache_dir):
+        with open(meta_path, encoding="utf-8") as f:
+            saved = json.load(f)["fingerprint"]
+        print(f"Using cached feature matrix in {cache_dir}")
+        return x_path, y_path, joblib.load(enc_path), saved
+
+    fp = snapshot.fingerprint(csv_path)
+    X, y, encoders = load_training_data(csv_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.save(x_path, np.ascontiguousarray(X, dtype=np.float64))
+    np.save(y_path, np.ascontiguousarray(y, dtype=np.float64))
+    joblib.dump(encoders, enc_path)
+    # meta.json last: a cache without it is never used
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({"version": snapshot.SNAPSHOT_VERSION, "fingerprint": fp}, f)
+    print(f"Feature matrix cached in {cache_dir}")
+    return x_path, y_path, encoders, fp
+
+
+# --- Workers ---
+_X = _y = None
+_thread_limits = None
+
+
+def _init_worker(x_path, y_path, threads):
+    global _X, _y, _thread_limits
+    from threadpoolctl import threadpool_limits
+
+    _X = np.load(x_path, mmap_mode="r")
+    _y = np.load(y_path, mmap_mode="r")
+    # N workers x all cores each would only fight over the CPUs
+    _thread_limits = threadpool_limits(limits=threads)
+
+
+def _evaluate(key, kind, params, folds, seed):
+    import train_model
+
+    start = time.perf_counter()
+    scores, fit_seconds = [], []
+    for train_idx, test_idx in KFold(n_splits=folds, shuffle=True, random_state=seed).split(_X):
+        model = train_model.build_model(kind, params)
+        fit_start = time.perf_counter()
+        model.fit(_X[train_idx], _y[train_idx])
+        fit_seconds.append(round(time.perf_counter() - fit_start, 3))
+        scores.append(float(r2_score(_y[test_idx], model.predict(_X[test_idx]))))
+    return {
+        "key": key,
+        "kind": kind,
+        "params": params,
+        "scores": [round(s, 5) for s in scores],
+        "mean_r2": round(float(np.mean(scores)), 5),
+        "std_r2": round(float(np.std(scores)), 5),
+        "fit_seconds": fit_seconds,
+        "wall_seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+# --- Search ---
+def _config_key(kind, params, folds, seed, data_fp):
+    return json.dumps({"kind": kind, "params": params, "folds": folds, "seed": seed, "data": data_fp["sha1"]}, sort_keys=True)
+
+
+def _read_results(path):
+    results = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # a line cut short by an interrupted run
+                results[row["key"]] = row
+    except OSError:
+        pass
+    return results
+
+
+def run_search(kind, csv_path, cache_dir, results_path, report_path, model_path, encoders_path,
+               load_training_data, n_random=None, folds=5, workers=None, seed=42):
+    """Cross-validate the configurations, refit the best on all rows and save it with a JSON report"""
+    search_start = time.perf_counter()
+    x_path, y_path, encoders, data_fp = encoded_matrix(csv_path, cache_dir, load_training_data)
+
+    configs = configurations(kind, n_random, seed)
+    keys = [_config_key(kind, params, folds, seed, data_fp) for params in configs]
+    done = _read_results(results_path)
+    pending = [(key, params) for key, params in zip(keys, configs) if key not in done]
+    print(f"{len(configs)} configurations x {folds} folds: {len(configs) - len(pending)} already in {results_path}")
+
+    if pending:
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending)))
+        threads = max(1, (os.cpu_count() or 1) // workers)
+        # spawn: OpenMP (used by the hist model) does not survive fork
+        context = multiprocessing.get_context("spawn")
+        with open(results_path, "a", encoding="utf-8") as out, ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(x_path, y_path, threads)
+        ) as pool:
+            futures = [pool.submit(_evaluate, key, kind, params, folds, seed) for key, params in pending]
+            for i, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                out.write(json.dumps(row) + "\n")
+                out.flush()
+                done[row["key"]] = row
+                print(f"[{i}/{len(pending)}] R² {row['mean_r2']:.4f} ± {row['std_r2']:.4f} "
+                      f"in {row['wall_seconds']:.1f}s {row['params']}")
+
+    rows = sorted((done[key] for key in keys), key=lambda r: r["mean_r2"], reverse=True)
+    best = rows[0]
+    print(f"Best: R² {best['mean_r2']:.4f} {best['params']}")
+
+    import train_model
+
+    X, y = np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+    model = train_model.build_model(kind, best["params"])
+    start = time.perf_counter()
+    model.fit(X, y)
+    refit_seconds = time.perf_counter() - start
+    joblib.dump(model, model_path)
+    joblib.dump(encoders, encoders_path)
+
+    report = {
+        "kind": kind,
+        "folds": folds,
+        "seed": seed,
+        "rows": len(y),
+        "data": data_fp,
+        "configurations": len(configs),
+        "resumed": len(configs) - len(pending),
+        "search_seconds": round(time.perf_counter() - search_start, 2),
+        "refit_seconds": round(refit_seconds, 2),
+        "best": {key: best[key] for key in ("params", "mean_r2", "std_r2")},
+        "results": [{k: v for k, v in row.items() if k != "key"} for row in rows],
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Model saved ({kind}), report in {report_path}")
+    return report
@@ -20,12 +20,13 @@ interface PredictionResult {
     product_rate: number;
     image_url: string;
   }[];
+  // null when the category has no products to compare with
   price_recommendation: {
     min: number;
     median: number;
     max: number;
     optimal: number;
-  };
+  } | null;
 }
 
 export default function PredictPage() {
@@ -195,42 +196,52 @@ export default function PredictPage() {
               </div>
 
               {/* Price Recommendation */}
-              <div className="bg-white rounded-2xl p-6 shadow-sm border border-kaspi-gray-100">
-                <div className="flex items-center gap-2 mb-4">
-                  <Target size={18} className="text-kaspi-red" />
-                  <h3 className="text-sm font-semibold text-kaspi-dark">Рекомендация по цене</h3>
-                </div>
-                <div className="grid grid-cols-4 gap-4">
-                  {[
-                    { label: "Минимум (10%)", value: result.price_recommendation.min, color: "#EF4444" },
-                    { label: "Оптимальная", value: result.price_recommendation.optimal, color: "#22C55E" },
-                    { label: "Медиана", value: result.price_recommendation.median, color: "#3B82F6" },
-                    { label: "Максимум (90%)", value: result.price_recommendation.max, color: "#F59E0B" },
-                  ].map((item) => (
-                    <div key={item.label} className="bg-kaspi-gray-50 rounded-xl p-4 text-center">
-                      <div className="w-2 h-2 rounded-full mx-auto mb-2" style={{ backgroundColor: item.color }} />
-                      <p className="text-lg font-bold text-kaspi-dark">{formatPrice(item.value)}</p>
-                      <p className="text-[10px] text-kaspi-gray-500 mt-1">{item.label}</p>
-                    </div>
-                  ))}
+              {result.price_recommendation ? (
+                <div className="bg-white rounded-2xl p-6 shadow-sm border border-kaspi-gray-100">
+                  <div className="flex items-center gap-2 mb-4">
+                    <Target size={18} className="text-kaspi-red" />
+                    <h3 className="text-sm font-semibold text-kaspi-dark">Рекомендация по цене</h3>
+                  </div>
+                  <div className="grid grid-cols-4 gap-4">
+                    {[
+                      { label: "Минимум (10%)", value: result.price_recommendation.min, color: "#EF4444" },
+                      { label: "Оптимальная", value: result.price_recommendation.optimal, color: "#22C55E" },
+                      { label: "Медиана", value: result.price_recommendation.median, color: "#3B82F6" },
+                      { label: "Максимум (90%)", value: result.price_recommendation.max, color: "#F59E0B" },
+                    ].map((item) => (
+                      <div key={item.label} className="bg-kaspi-gray-50 rounded-xl p-4 text-center">
+                        <div className="w-2 h-2 rounded-full mx-auto mb-2" style={{ backgroundColor: item.color }} />
+                        <p className="text-lg font-bold text-kaspi-dark">{formatPrice(item.value)}</p>
+                        <p className="text-[10px] text-kaspi-gray-500 mt-1">{item.label}</p>
+                      </div>
+                    ))}
+                  </div>
+                  {/* Price Bar */}
+                  <div className="mt-4 relative h-3 bg-kaspi-gray-100 rounded-full overflow-hidden">
+                    <div
+                      className="absolute h-full bg-gradient-to-r from-red-400 via-green-400 to-yellow-400 rounded-full"
+                      style={{ left: "0%", width: "100%" }}
+                    />
+                    <div
+                      className="absolute top-1/2 -translate-y-1/2 w-4 h-4 rounded-full bg-kaspi-dark border-2 border-white shadow-md"
+                      style={{
+                        left: `${Math.min(100, Math.max(0, ((price - result.price_recommendation.min) / (result.price_recommendation.max - result.price_recommendation.min)) * 100))}%`,
+                      }}
+                    />
+                  </div>
+                  <p className="text-xs text-kaspi-gray-500 mt-2 text-center">
+                    Ваша цена: {formatPrice(price)} — {price <= result.price_recommendation.optimal ? "ниже оптимальной ✅" : price <= result.price_recommendation.median ? "в оптимальном диапазоне ✅" : "выше медианы ⚠️"}
+                  </p>
                 </div>
-                {/* Price Bar */}
-                <div className="mt-4 relative h-3 bg-kaspi-gray-100 rounded-full overflow-hidden">
-                  <div
-                    className="absolute h-full bg-gradient-to-r from-red-400 via-green-400 to-yellow-400 rounded-full"
-                    style={{ left: "0%", width: "100%" }}
-                  />
-                  <div
-                    className="absolute top-1/2 -translate-y-1/2 w-4 h-4 rounded-full bg-kaspi-dark border-2 border-white shadow-md"
-                    style={{
-                      left: `${Math.min(100, Math.max(0, ((price - result.price_recommendation.min) / (result.price_recommendation.max - result.price_recommendation.min)) * 100))}%`,
-                    }}
-                  />
+              ) : (
+                <div className="bg-white rounded-2xl p-6 shadow-sm border border-kaspi-gray-100">
+                  <div className="flex items-center gap-2">
+                    <Target size={18} className="text-kaspi-red" />
+                    <h3 className="text-sm font-semibold text-kaspi-dark">Рекомендация по цене</h3>
+                  </div>
+                  <p className="text-sm text-kaspi-gray-500 mt-3">Нет товаров этой категории для сравнения цен</p>
                 </div>
-                <p className="text-xs text-kaspi-gray-500 mt-2 text-center">
-                  Ваша цена: {formatPrice(price)} — {price <= result.price_recommendation.optimal ? "ниже оптимальной ✅" : price <= result.price_recommendation.median ? "в оптимальном диапазоне ✅" : "выше медианы ⚠️"}
-                </p>
-              </div>
+              )}
 
               {/* Similar Products */}
               {result.similar_products.length > 0 && (